@@ -1,11 +1,22 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-import hashlib
-import secrets
 from datetime import datetime
 import plotly.express as px
 import os
+from entidades import leer_entidades, nombres_entidades
+import carga_masiva
+import estadisticas
+import limitador
+import auditoria
+import estado
+
+# Tablas internas (auditoría, colas, limitador, sesiones, credenciales
+# generadas): pueden ser grandes o tener datos sensibles, así que el
+# diagnóstico solo muestra la cantidad de filas.
+TABLAS_INTERNAS = ('auditoria', 'carga_masiva_', 'limitador_', 'recordatorios_',
+                   'sesiones', 'invalidaciones', 'estadisticas_', 'sqlite_')
+LIMITE_DIAGNOSTICO = 100
 
 # Función de diagnóstico de bases de datos
 def check_all_databases():
@@ -27,14 +38,18 @@ def check_all_databases():
                 # Para cada tabla, mostrar su contenido
                 for table in tables:
                     table_name = table[0]
-                    st.write(f"\nContenido de la tabla {table_name}:")
+                    if table_name.startswith(TABLAS_INTERNAS):
+                        c.execute(f"SELECT COUNT(*) FROM {table_name}")
+                        st.write(f"\nTabla interna {table_name}: {c.fetchone()[0]} filas")
+                        continue
+                    st.write(f"\nContenido de la tabla {table_name} (primeras {LIMITE_DIAGNOSTICO} filas):")
                     
                     # Obtener estructura de la tabla
                     c.execute(f"PRAGMA table_info({table_name})")
                     columns = [col[1] for col in c.fetchall()]
                     
                     # Obtener datos
-                    c.execute(f"SELECT * FROM {table_name}")
+                    c.execute(f"SELECT * FROM {table_name} LIMIT {LIMITE_DIAGNOSTICO}")
                     records = c.fetchall()
                     
                     if records:
@@ -49,6 +64,113 @@ def check_all_databases():
         except Exception as e:
             st.write(f"Error al verificar {db_name}: {str(e)}")
 
+def ejecutar_carga_masiva(db_path, trabajo_id):
+    progress = st.progress(0.0, text="Hasheando credenciales...")
+
+    def mostrar(procesados, total, por_segundo):
+        progress.progress(
+            procesados / total if total else 1.0,
+            text=f"{procesados}/{total} procesados ({por_segundo:.1f} por segundo)"
+        )
+
+    resumen = carga_masiva.ejecutar_trabajo(db_path, trabajo_id, mostrar)
+    progress.progress(1.0, text="Carga finalizada")
+    estadisticas.marcar_desactualizado(db_path)
+    st.success(
+        f"Trabajo {trabajo_id}: {resumen['aplicados']} de {resumen['total']} usuarios actualizados "
+        f"en {resumen['segundos']:.1f} s ({resumen['por_segundo']:.1f} por segundo)"
+    )
+
+# Alta y reseteo masivo de credenciales
+def carga_masiva_ui(db_path):
+    st.subheader("Carga Masiva")
+    modo = st.radio("Operación", ["Alta de entidades", "Reseteo de contraseñas"], horizontal=True)
+    modo = 'alta' if modo == "Alta de entidades" else 'reseteo'
+
+    origen_todos = "Todas las entidades sin registrar" if modo == 'alta' else "Todos los usuarios registrados"
+    origen = st.radio("Entidades", [origen_todos, "Desde archivo CSV"], horizontal=True)
+    archivo = None
+    if origen == "Desde archivo CSV":
+        archivo = st.file_uploader("CSV con una columna 'Entidad' (y opcionalmente 'Contraseña')", type=['csv'])
+
+    password_comun = st.text_input(
+        "Contraseña común (dejar vacío para generar una por entidad)",
+        type="password",
+        key="carga_masiva_password"
+    )
+
+    # Resetear cierra las sesiones de todas las entidades elegidas
+    confirmado = True
+    if modo == 'reseteo':
+        st.warning("⚠️ Se reemplazarán las contraseñas y se cerrarán las sesiones abiertas")
+        confirmado = st.checkbox("Confirmo que quiero resetear las contraseñas", key="confirmar_reseteo_masivo")
+
+    if st.button("Iniciar carga masiva") and confirmado:
+        if archivo is not None:
+            credenciales, desconocidas = carga_masiva.filtrar_padron(
+                carga_masiva.leer_nombres_csv(archivo),
+                nombres_entidades(leer_entidades())
+            )
+            if desconocidas:
+                st.warning(
+                    f"{len(desconocidas)} entidades del archivo no figuran en el padrón y se omiten: "
+                    + ", ".join(desconocidas)
+                )
+        elif origen == "Desde archivo CSV":
+            credenciales = []
+        elif modo == 'alta':
+            nombres = nombres_entidades(leer_entidades())
+            credenciales = [(n, None) for n in carga_masiva.entidades_sin_registrar(db_path, nombres)]
+        else:
+            credenciales = [(u, None) for u in carga_masiva.usuarios_registrados(db_path)]
+
+        if credenciales:
+            trabajo_id = carga_masiva.crear_trabajo(db_path, modo, credenciales, password_comun or None)
+            ejecutar_carga_masiva(db_path, trabajo_id)
+        else:
+            st.warning("No hay entidades para procesar")
+
+    # Trabajos interrumpidos
+    for trabajo in carga_masiva.trabajos_pendientes(db_path):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.write(
+                f"Trabajo {trabajo['id']} ({trabajo['modo']}) interrumpido: "
+                f"{trabajo['hasheados']}/{trabajo['total']} procesados"
+            )
+        with col2:
+            if st.button("Reanudar", key=f"reanudar_{trabajo['id']}"):
+                ejecutar_carga_masiva(db_path, trabajo['id'])
+
+    # Entrega de contraseñas generadas; se listan desde la base para que
+    # sigan disponibles aunque se recargue la página
+    for trabajo in carga_masiva.trabajos_por_entregar(db_path):
+        trabajo_id = trabajo['id']
+        generadas = carga_masiva.credenciales_generadas(db_path, trabajo_id)
+        if not generadas:
+            continue
+        st.write(
+            f"Trabajo {trabajo_id} ({trabajo['modo']}, {trabajo['finished_at']}): "
+            f"{len(generadas)} contraseñas generadas sin descargar"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            df = pd.DataFrame(generadas, columns=['Entidad', 'Contraseña'])
+            # Al descargarlas se borran de la base
+            st.download_button(
+                "Descargar contraseñas generadas",
+                df.to_csv(index=False).encode('utf-8'),
+                file_name=f"credenciales_{trabajo_id}.csv",
+                mime="text/csv",
+                key=f"descargar_{trabajo_id}",
+                on_click=carga_masiva.descartar_credenciales,
+                args=(db_path, trabajo_id)
+            )
+        with col2:
+            if st.button("Descartar contraseñas generadas", key=f"descartar_{trabajo_id}"):
+                carga_masiva.descartar_credenciales(db_path, trabajo_id)
+                st.rerun()
+
 def admin_app():
     st.set_page_config(page_title="CAME - Panel Administrativo", layout="wide")
     
@@ -64,45 +186,20 @@ def admin_app():
     st.sidebar.title("Menú")
     page = st.sidebar.selectbox(
         "Seleccionar página",
-        ["Usuarios", "Gestión de Usuarios", "Estadísticas"]
+        ["Usuarios", "Gestión de Usuarios", "Estadísticas", "Estadísticas por Ubicación", "Auditoría"]
     )
     
     # Página de Usuarios
     if page == "Usuarios":
         st.header("Lista de Usuarios Registrados")
         
-        conn = sqlite3.connect(db_path)
         try:
-            c = conn.cursor()
-            
-            # Mostrar estructura de la tabla users
-            st.write("Estructura de la tabla users:")
-            c.execute("PRAGMA table_info(users);")
-            st.table(pd.DataFrame(c.fetchall(), 
-                                columns=['cid', 'name', 'type', 'notnull', 'dflt_value', 'pk']))
-            
-            # Contar registros
-            c.execute("SELECT COUNT(*) FROM users")
-            count = c.fetchone()[0]
-            st.write(f"Número total de registros: {count}")
-            
-            # Mostrar todos los registros
-            c.execute("""
-                SELECT 
-                    username,
-                    created_at,
-                    last_login,
-                    email,
-                    telefono,
-                    fecha_fundacion
-                FROM users
-                ORDER BY created_at DESC
-            """)
-            columns = [description[0] for description in c.description]
-            data = c.fetchall()
+            # Los usuarios se leen del backend de estado, compartido por todas las réplicas
+            data = estado.obtener_backend(db_path, rol='admin').listar_usuarios()
+            st.write(f"Número total de registros: {len(data)}")
             
             if data:
-                df = pd.DataFrame(data, columns=columns)
+                df = pd.DataFrame(data)[['username', 'created_at', 'last_login', 'email', 'telefono', 'fecha_fundacion']]
                 
                 # Formatear fechas
                 for col in ['created_at', 'last_login']:
@@ -136,23 +233,19 @@ def admin_app():
 
         except Exception as e:
             st.error(f"Error al acceder a la base de datos: {str(e)}")
-        finally:
-            conn.close()
     
     # Página de Gestión de Usuarios
     elif page == "Gestión de Usuarios":
         st.header("Gestión de Usuarios")
         
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
+        backend = estado.obtener_backend(db_path, rol='admin')
         
         try:
             # Obtener lista de usuarios
-            c.execute("SELECT username FROM users ORDER BY created_at DESC")
-            usuarios = [row[0] for row in c.fetchall()]
+            usuarios = carga_masiva.usuarios_registrados(db_path)
             
             if usuarios:
-                tab1, tab2 = st.tabs(["Resetear Contraseña", "Eliminar Usuario"])
+                tab1, tab2, tab3 = st.tabs(["Resetear Contraseña", "Eliminar Usuario", "Carga Masiva"])
                 
                 with tab1:
                     st.subheader("Resetear Contraseña")
@@ -165,20 +258,11 @@ def admin_app():
                     
                     if st.button("Resetear Contraseña"):
                         if new_password == confirm_password:
-                            salt = secrets.token_hex(16)
-                            hash_obj = hashlib.pbkdf2_hmac(
-                                'sha256',
-                                new_password.encode('utf-8'),
-                                salt.encode('utf-8'),
-                                100000
-                            )
-                            password_hash = hash_obj.hex()
+                            _, password_hash, salt = carga_masiva._hashear((reset_username, new_password))
                             
-                            c.execute(
-                                'UPDATE users SET password_hash = ?, salt = ? WHERE username = ?',
-                                (password_hash, salt, reset_username)
-                            )
-                            conn.commit()
+                            # Por el backend, para cerrar las sesiones abiertas en todas las réplicas
+                            backend.actualizar_password(reset_username, password_hash, salt)
+                            auditoria.registrar('admin', 'admin', 'reset_password', reset_username, db_path=db_path, rol='admin')
                             st.success(f"Contraseña reseteada para {reset_username}")
                         else:
                             st.error("Las contraseñas no coinciden")
@@ -195,43 +279,45 @@ def admin_app():
                     confirm_delete = st.checkbox("Confirmo que quiero eliminar este usuario")
                     
                     if st.button("Eliminar Usuario") and confirm_delete:
-                        c.execute('DELETE FROM users WHERE username = ?', (delete_username,))
-                        conn.commit()
+                        antes = backend.obtener_usuario(delete_username)
+                        backend.eliminar_usuario(delete_username)
+                        auditoria.registrar('admin', 'admin', 'eliminar_usuario', delete_username, antes,
+                                            db_path=db_path, rol='admin')
+                        estadisticas.registrar_baja(delete_username, db_path, rol='admin')
                         st.success(f"Usuario {delete_username} eliminado correctamente")
                         st.rerun()
+                
+                with tab3:
+                    carga_masiva_ui(db_path)
             else:
                 st.info("No hay usuarios registrados en el sistema")
+                carga_masiva_ui(db_path)
                 
         except Exception as e:
             st.error(f"Error en la gestión de usuarios: {str(e)}")
-        finally:
-            conn.close()
     
     # Página de Estadísticas
     elif page == "Estadísticas":
         st.header("Estadísticas del Sistema")
         
-        conn = sqlite3.connect(db_path)
         try:
-            c = conn.cursor()
+            usuarios = pd.DataFrame(
+                estado.obtener_backend(db_path, rol='admin').listar_usuarios(),
+                columns=estado.CAMPOS_USUARIO
+            )
+            created_at = pd.to_datetime(usuarios['created_at'], errors='coerce')
+            last_login = pd.to_datetime(usuarios['last_login'], errors='coerce')
+            # Las fechas se guardan en UTC (CURRENT_TIMESTAMP de SQLite)
+            limite = pd.Timestamp.now('UTC').tz_localize(None) - pd.Timedelta(days=30)
             
             # Total de usuarios
-            c.execute("SELECT COUNT(*) FROM users")
-            total_users = c.fetchone()[0]
+            total_users = len(usuarios)
             
             # Usuarios nuevos (últimos 30 días)
-            c.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE created_at >= datetime('now', '-30 days')
-            """)
-            new_users = c.fetchone()[0]
+            new_users = int((created_at >= limite).sum())
             
             # Usuarios activos (últimos 30 días)
-            c.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE last_login >= datetime('now', '-30 days')
-            """)
-            active_users = c.fetchone()[0]
+            active_users = int((last_login >= limite).sum())
             
             # Mostrar métricas
             col1, col2, col3 = st.columns(3)
@@ -242,16 +328,24 @@ def admin_app():
             with col3:
                 st.metric("Usuarios activos (30 días)", active_users)
             
+            # Intentos de login rechazados (solo con un limitador compartido)
+            limitador_db = os.environ.get('LIMITADOR_DB')
+            if limitador_db:
+                contadores = limitador.contadores_guardados(limitador_db)
+            else:
+                contadores = estado.obtener_backend(db_path, rol='admin').contadores_limitador()
+            if contadores:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Intentos de login permitidos", int(contadores['permitidos']))
+                with col2:
+                    st.metric("Intentos de login rechazados", int(contadores['rechazados']))
+                with col3:
+                    st.metric("CPU ahorrado (segundos)", f"{contadores['cpu_ahorrado']:.1f}")
+            
             # Gráfico de registros por mes
-            c.execute("""
-                SELECT 
-                    strftime('%Y-%m', created_at) as month,
-                    COUNT(*) as count
-                FROM users
-                GROUP BY strftime('%Y-%m', created_at)
-                ORDER BY month
-            """)
-            monthly_data = pd.DataFrame(c.fetchall(), columns=['Mes', 'Cantidad'])
+            monthly_data = (created_at.dt.strftime('%Y-%m').value_counts().sort_index()
+                            .rename_axis('Mes').reset_index(name='Cantidad'))
             
             if not monthly_data.empty:
                 fig = px.bar(
@@ -264,8 +358,132 @@ def admin_app():
             
         except Exception as e:
             st.error(f"Error al generar estadísticas: {str(e)}")
-        finally:
-            conn.close()
+    
+    # Página de Estadísticas por Ubicación
+    elif page == "Estadísticas por Ubicación":
+        st.header("Estadísticas por Ubicación")
+        
+        try:
+            cubo = estadisticas.consultar_cubo(db_path)
+            
+            if not cubo.empty:
+                # Filtros de drill-down
+                col1, col2 = st.columns(2)
+                with col1:
+                    provincia = st.selectbox("Provincia", ["Todas"] + sorted(cubo['provincia'].unique()))
+                if provincia != "Todas":
+                    cubo = cubo[cubo['provincia'] == provincia]
+                with col2:
+                    localidad = st.selectbox(
+                        "Localidad",
+                        ["Todas"] + sorted(cubo['localidad'].unique()),
+                        disabled=provincia == "Todas"
+                    )
+                if localidad != "Todas":
+                    cubo = cubo[cubo['localidad'] == localidad]
+                
+                # Mostrar métricas
+                total = cubo['cantidad'].sum()
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Entidades", total)
+                with col2:
+                    st.metric("Registradas", cubo.loc[cubo['registrada'] == 1, 'cantidad'].sum())
+                with col3:
+                    st.metric("Activas (30 días)", cubo.loc[cubo['activa'] == 1, 'cantidad'].sum())
+                with col4:
+                    st.metric("Documentación completa", cubo.loc[cubo['documentacion'] == "Completa", 'cantidad'].sum())
+                
+                # Gráfico por el siguiente nivel geográfico
+                nivel = 'provincia' if provincia == "Todas" else 'localidad'
+                if localidad == "Todas":
+                    por_nivel = cubo.groupby([nivel, 'documentacion'])['cantidad'].sum().reset_index()
+                    fig = px.bar(
+                        por_nivel,
+                        x=nivel,
+                        y='cantidad',
+                        color='documentacion',
+                        title=f"Documentación por {nivel}",
+                        labels={nivel: nivel.capitalize(), 'cantidad': 'Cantidad', 'documentacion': 'Documentación'}
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+                
+                # Detalle por estado
+                detalle = cubo.groupby(['nomina', 'documentacion', 'registrada', 'activa'])['cantidad'].sum().reset_index()
+                detalle['registrada'] = detalle['registrada'].map({1: 'Si', 0: 'No'})
+                detalle['activa'] = detalle['activa'].map({1: 'Si', 0: 'No'})
+                detalle = detalle.rename(columns={
+                    'nomina': 'Nómina',
+                    'documentacion': 'Documentación',
+                    'registrada': 'Registrada',
+                    'activa': 'Activa',
+                    'cantidad': 'Cantidad'
+                })
+                st.dataframe(detalle, hide_index=True, use_container_width=True)
+            else:
+                st.warning("No hay datos de entidades para mostrar")
+            
+        except Exception as e:
+            st.error(f"Error al generar estadísticas: {str(e)}")
+    
+    # Página de Auditoría
+    elif page == "Auditoría":
+        st.header("Registro de Auditoría")
+        
+        try:
+            # Filtros
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                entidad = st.text_input("Entidad")
+            with col2:
+                accion = st.selectbox("Acción", ["Todas"] + auditoria.ACCIONES)
+            with col3:
+                desde = st.date_input("Desde", value=None)
+            with col4:
+                hasta = st.date_input("Hasta", value=None)
+            
+            filtros = (entidad, accion, desde, hasta)
+            accion = None if accion == "Todas" else accion
+            
+            # Cursores de las páginas visitadas; se reinician al cambiar los filtros
+            if st.session_state.get('auditoria_filtros') != filtros:
+                st.session_state.auditoria_filtros = filtros
+                st.session_state.auditoria_cursores = [None]
+            cursores = st.session_state.auditoria_cursores
+            
+            eventos, siguiente = estado.obtener_backend(db_path, rol='admin').consultar_auditoria(
+                entidad.strip() or None, accion, desde, hasta, cursores[-1]
+            )
+            
+            if eventos:
+                df = pd.DataFrame(eventos).drop(columns=['id'])
+                df = df.rename(columns={
+                    'ts': 'Fecha (UTC)',
+                    'origen': 'Origen',
+                    'actor': 'Usuario',
+                    'accion': 'Acción',
+                    'entidad': 'Entidad',
+                    'antes': 'Antes',
+                    'despues': 'Después'
+                })
+                st.dataframe(df, hide_index=True, use_container_width=True)
+            else:
+                st.info("No hay eventos para los filtros seleccionados")
+            
+            col1, col2, col3 = st.columns([1, 1, 4])
+            with col1:
+                if st.button("Anteriores", disabled=len(cursores) == 1):
+                    cursores.pop()
+                    st.rerun()
+            with col2:
+                if st.button("Siguientes", disabled=siguiente is None):
+                    cursores.append(siguiente)
+                    st.rerun()
+            with col3:
+                st.write(f"Página {len(cursores)}")
+            
+        except Exception as e:
+            st.error(f"Error al consultar la auditoría: {str(e)}")
 
 # Ejecutar la aplicación
 admin_app()
\ No newline at end of file
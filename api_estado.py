@@ -0,0 +1,169 @@
+import json
+import hashlib
+import argparse
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from entidades import obtener_snapshot, registro_entidad, normalizar_cuit
+
+# API de solo lectura con el estado de las entidades, pensada para que otros
+# sistemas internos no tengan que consultar la app de Streamlit.
+#
+#   GET  /entidades?cuit=30635505318            una entidad por CUIT (409 si hay varias)
+#   GET  /entidades?nombre=asociacion amigos...  una entidad por nombre normalizado
+#   GET  /entidades?cuit=307...,306...          varias entidades por CUIT
+#   POST /entidades/lote  {"cuits": [...]}       varias entidades por CUIT
+#   GET  /version                               versión del snapshot
+#
+# Todas las respuestas llevan un ETag derivado de la versión del snapshot, por
+# lo que los clientes pueden repetir una consulta GET con If-None-Match y
+# recibir un 304 sin cuerpo mientras el padrón no cambie (en POST el
+# encabezado se ignora). Los CUITs deben tener 11 dígitos; los que comparten
+# varias entidades se informan como ambiguos.
+
+MAX_LOTE = 500
+
+def _etag(snapshot, clave):
+    # El estado de vencimiento depende de la fecha, por eso también forma parte
+    hoy = datetime.date.today().isoformat()
+    consulta = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:8]
+    return f'"{snapshot.version}-{hoy}-{consulta}"'
+
+def coincide_etag(if_none_match, etag):
+    # If-None-Match admite '*' o una lista de ETags separados por coma; la
+    # comparación es débil, así que se ignora el prefijo W/
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    etags = [e.strip() for e in if_none_match.split(',')]
+    return etag in [e[2:] if e.startswith('W/') else e for e in etags]
+
+def buscar_lote(snapshot, cuits):
+    encontrados = {}
+    ambiguos = {}
+    no_encontrados = []
+    invalidos = []
+    for cuit in cuits:
+        if normalizar_cuit(cuit) is None:
+            invalidos.append(cuit)
+            continue
+        rows = snapshot.buscar_cuit(cuit)
+        if not rows:
+            no_encontrados.append(cuit)
+        elif len(rows) > 1:
+            ambiguos[normalizar_cuit(cuit)] = [registro_entidad(row) for row in rows]
+        else:
+            encontrados[normalizar_cuit(cuit)] = registro_entidad(rows[0])
+    return {
+        'version': snapshot.version,
+        'entidades': encontrados,
+        'ambiguos': ambiguos,
+        'no_encontrados': no_encontrados,
+        'invalidos': invalidos
+    }
+
+class EstadoHandler(BaseHTTPRequestHandler):
+    server_version = "AutogestionCAME"
+
+    def _responder(self, status, cuerpo, etag=None):
+        if etag and self.command == 'GET' and coincide_etag(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        data = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, mensaje):
+        self._responder(status, {'error': mensaje})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        try:
+            snapshot = obtener_snapshot()
+        except Exception as e:
+            return self._error(503, f"Padrón no disponible: {str(e)}")
+
+        if url.path == '/version':
+            return self._responder(200, {'version': snapshot.version}, _etag(snapshot, url.path))
+
+        if url.path != '/entidades':
+            return self._error(404, "Recurso no encontrado")
+
+        etag = _etag(snapshot, url.query)
+        if 'cuit' in params:
+            cuits = [c.strip() for valor in params['cuit'] for c in valor.split(',') if c.strip()]
+            if len(cuits) > MAX_LOTE:
+                return self._error(400, f"Máximo {MAX_LOTE} CUITs por consulta")
+            if len(cuits) == 1:
+                if normalizar_cuit(cuits[0]) is None:
+                    return self._error(400, "CUIT inválido: debe tener 11 dígitos")
+                rows = snapshot.buscar_cuit(cuits[0])
+                if not rows:
+                    return self._error(404, "Entidad no encontrada")
+                if len(rows) > 1:
+                    return self._responder(409, {
+                        'error': "El CUIT corresponde a varias entidades",
+                        'entidades': [registro_entidad(row) for row in rows]
+                    })
+                return self._responder(200, registro_entidad(rows[0]), etag)
+            return self._responder(200, buscar_lote(snapshot, cuits), etag)
+
+        if 'nombre' in params:
+            row = snapshot.buscar_nombre(params['nombre'][0])
+            if row is None:
+                return self._error(404, "Entidad no encontrada")
+            return self._responder(200, registro_entidad(row), etag)
+
+        return self._error(400, "Indicar 'cuit' o 'nombre'")
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/entidades/lote':
+            return self._error(404, "Recurso no encontrado")
+        try:
+            largo = int(self.headers.get('Content-Length', 0))
+            cuerpo = json.loads(self.rfile.read(largo) or b'{}')
+            cuits = [str(c) for c in cuerpo.get('cuits', [])]
+        except Exception:
+            return self._error(400, "Cuerpo JSON inválido")
+        if len(cuits) > MAX_LOTE:
+            return self._error(400, f"Máximo {MAX_LOTE} CUITs por consulta")
+
+        try:
+            snapshot = obtener_snapshot()
+        except Exception as e:
+            return self._error(503, f"Padrón no disponible: {str(e)}")
+        etag = _etag(snapshot, ','.join(cuits))
+        self._responder(200, buscar_lote(snapshot, cuits), etag)
+
+    def log_message(self, format, *args):
+        print(f"[api_estado] {self.address_string()} - {format % args}")
+
+def main():
+    parser = argparse.ArgumentParser(description="API de estado de entidades")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    # Cargar el snapshot antes de aceptar conexiones
+    obtener_snapshot()
+    server = ThreadingHTTPServer((args.host, args.port), EstadoHandler)
+    print(f"API de estado escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+import atexit
+import json
+import datetime
+import estado
+
+# Registro de auditoría de escrituras del panel administrativo y de la app.
+#
+# registrar() solo agrega el evento a un buffer en memoria; un hilo en segundo
+# plano lo envía al backend de estado (estado.py) cada INTERVALO segundos (o
+# antes si se juntan MAX_BUFFER eventos), y el backend lo vuelca a la tabla
+# auditoria de su base con un único executemany por transacción. Así los
+# eventos de todas las réplicas quedan en la misma tabla. La tabla es de solo
+# inserción y está indexada por entidad y por fecha para paginar el historial
+# con cursores (keyset) en lugar de OFFSET.
+
+INTERVALO = 2.0
+MAX_BUFFER = 200
+TAM_PAGINA = 50
+
+ACCIONES = [
+    'alta', 'login', 'actualizar_perfil', 'subir_documento',
+    'reset_password', 'eliminar_usuario', 'alta_masiva', 'reset_masivo'
+]
+
+def init_tablas(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS auditoria (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TIMESTAMP NOT NULL,
+            origen TEXT NOT NULL,
+            actor TEXT NOT NULL,
+            accion TEXT NOT NULL,
+            entidad TEXT,
+            antes TEXT,
+            despues TEXT
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_entidad ON auditoria (entidad, ts, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_ts ON auditoria (ts, id)')
+    # Solo inserción: la base rechaza cualquier modificación o borrado
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS auditoria_sin_update BEFORE UPDATE ON auditoria
+        BEGIN SELECT RAISE(ABORT, 'La auditoría es de solo inserción'); END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS auditoria_sin_delete BEFORE DELETE ON auditoria
+        BEGIN SELECT RAISE(ABORT, 'La auditoría es de solo inserción'); END
+    ''')
+    conn.commit()
+
+def _ahora():
+    # Mismo formato y zona horaria que CURRENT_TIMESTAMP de SQLite
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _json(valor):
+    if valor is None:
+        return None
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
+def evento(origen, actor, accion, entidad=None, antes=None, despues=None):
+    return (_ahora(), origen, actor, accion, entidad, _json(antes), _json(despues))
+
+def insertar(conn, eventos):
+    # Inserta dentro de la transacción del llamador
+    conn.executemany('''
+        INSERT INTO auditoria (ts, origen, actor, accion, entidad, antes, despues)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', eventos)
+
+class BufferAuditoria:
+    def __init__(self, escribir, intervalo=INTERVALO, max_buffer=MAX_BUFFER):
+        # escribir recibe la lista de eventos y los guarda
+        self.escribir = escribir
+        self.intervalo = intervalo
+        self.max_buffer = max_buffer
+        self._eventos = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._despertar = threading.Event()
+
+        self._hilo = threading.Thread(target=self._ciclo, name="auditoria", daemon=True)
+        self._hilo.start()
+
+    def registrar(self, evento):
+        with self._lock:
+            self._eventos.append(evento)
+            lleno = len(self._eventos) >= self.max_buffer
+        if lleno:
+            self._despertar.set()
+
+    def _ciclo(self):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                eventos, self._eventos = self._eventos, []
+            if not eventos:
+                return
+            try:
+                self.escribir(eventos)
+            except Exception as e:
+                # Se reintentan en el próximo ciclo
+                print(f"Error guardando auditoría: {str(e)}")
+                with self._lock:
+                    self._eventos = eventos + self._eventos
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+def _buffer(db_path, rol):
+    with _buffers_lock:
+        if (db_path, rol) not in _buffers:
+            _buffers[(db_path, rol)] = BufferAuditoria(
+                lambda eventos: estado.obtener_backend(db_path, rol=rol).registrar_auditoria(eventos)
+            )
+        return _buffers[(db_path, rol)]
+
+def registrar(origen, actor, accion, entidad=None, antes=None, despues=None, db_path='users.db', rol='app'):
+    try:
+        _buffer(db_path, rol).registrar(evento(origen, actor, accion, entidad, antes, despues))
+    except Exception as e:
+        print(f"Error registrando auditoría: {str(e)}")
+
+def flush():
+    with _buffers_lock:
+        buffers = list(_buffers.values())
+    for buffer in buffers:
+        buffer.flush()
+
+atexit.register(flush)
+
+def consultar(db_path='users.db', entidad=None, accion=None, desde=None, hasta=None,
+              cursor=None, limite=TAM_PAGINA):
+    # cursor es (ts, id) del último evento de la página anterior
+    query = 'SELECT id, ts, origen, actor, accion, entidad, antes, despues FROM auditoria WHERE 1 = 1'
+    params = []
+    if entidad:
+        query += ' AND entidad = ?'
+        params.append(entidad)
+    if accion:
+        query += ' AND accion = ?'
+        params.append(accion)
+    if desde:
+        query += ' AND ts >= ?'
+        params.append(desde.strftime('%Y-%m-%d'))
+    if hasta:
+        query += ' AND ts < ?'
+        params.append((hasta + datetime.timedelta(days=1)).strftime('%Y-%m-%d'))
+    if cursor:
+        query += ' AND (ts, id) < (?, ?)'
+        params.extend(cursor)
+    query += ' ORDER BY ts DESC, id DESC LIMIT ?'
+    params.append(limite + 1)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        c = conn.cursor()
+        c.execute(query, params)
+        columns = [d[0] for d in c.description]
+        filas = c.fetchall()
+    finally:
+        conn.close()
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = (filas[-1][1], filas[-1][0])
+    return [dict(zip(columns, fila)) for fila in filas], siguiente
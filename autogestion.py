@@ -1,11 +1,18 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
-import sqlite3
 import hashlib
 import secrets
 import datetime
+import time
 from pathlib import Path
 import os
+from entidades import leer_entidades
+import estadisticas
+import carga_masiva
+import limitador
+import auditoria
+import estado
 
 # Crear directorio de uploads si no existe
 if not os.path.exists("uploads"):
@@ -49,26 +56,8 @@ st.markdown("""
 
 # Configuración de la base de datos
 def init_db():
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password_hash TEXT NOT NULL,
-            salt TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            fecha_fundacion DATE,
-            email TEXT,
-            telefono TEXT,
-            facebook TEXT,
-            twitter TEXT,
-            instagram TEXT,
-            linkedin TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    # El backend crea las tablas si no existen
+    return estado.obtener_backend()
 
 # Funciones de autenticación
 def hash_password(password, salt=None):
@@ -78,148 +67,84 @@ def hash_password(password, salt=None):
         'sha256',
         password.encode('utf-8'),
         salt.encode('utf-8'),
-        100000
+        carga_masiva.ITERACIONES
     )
     return hash_obj.hex(), salt
 
 def verify_password(username, password):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('SELECT password_hash, salt FROM users WHERE username = ?', (username,))
-    result = c.fetchone()
-    conn.close()
+    result = backend.obtener_credenciales(username)
     
     if result:
         stored_hash, salt = result
+        inicio = time.perf_counter()
         password_hash, _ = hash_password(password, salt)
+        limitador.registrar_costo(time.perf_counter() - inicio)
         return password_hash == stored_hash
     return False
 
 def register_user(username, password):
     password_hash, salt = hash_password(password)
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
     try:
         # Agregar print para debug
         print(f"Intentando registrar usuario: {username}")
-        c.execute(
-            'INSERT INTO users (username, password_hash, salt, created_at) VALUES (?, ?, ?, datetime("now"))',
-            (username, password_hash, salt)
-        )
-        conn.commit()
-        # Verificar si se guardó
-        c.execute('SELECT * FROM users WHERE username = ?', (username,))
-        result = c.fetchone()
-        print(f"Resultado después de insertar: {result}")
+        if not backend.crear_usuario(username, password_hash, salt):
+            print(f"Error de integridad: {username} ya está registrado")
+            return False
+        estadisticas.registrar_alta(username)
+        auditoria.registrar('autogestion', username, 'alta', username)
         return True
-    except sqlite3.IntegrityError as e:
-        print(f"Error de integridad: {str(e)}")
-        return False
     except Exception as e:
         print(f"Error general: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 def update_last_login(username):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute(
-        'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?',
-        (username,)
-    )
-    conn.commit()
-    conn.close()
-
-# Funciones de manejo de datos
-def load_data():
-    try:
-        file_path = 'datos_entidades.csv'
-        
-        if not os.path.exists(file_path):
-            st.error(f"No se encontró el archivo {file_path}")
-            return pd.DataFrame()
-
-        # Lista de encodings a intentar
-        encodings = ['latin1', 'iso-8859-1', 'cp1252', 'utf-8-sig', 'utf-8']
-        separators = [';', ',', '\t']
-        
-        df = None
-        successful_encoding = None
-        successful_separator = None
-
-        # Probar diferentes combinaciones de codificación y separador
-        for encoding in encodings:
-            if df is not None:
-                break
-            for sep in separators:
-                try:
-                    df = pd.read_csv(file_path, 
-                                   encoding=encoding, 
-                                   sep=sep,
-                                   on_bad_lines='skip')
-                    successful_encoding = encoding
-                    successful_separator = sep
-                    break
-                except Exception as e:
-                    continue
-
-        if df is None:
-            st.error("No se pudo leer el archivo con ninguna combinación de codificación y separador")
-            return pd.DataFrame()
-
-        # Limpiar nombres de columnas
-        df.columns = df.columns.str.strip()
-
-        # Mapeo de columnas
-        columns_map = {
-            'Entidad': 'nombre_entidad',
-            'Sigla': 'sigla',
-            'Fecha de Ingreso': 'fecha_ingreso',
-            'Pertenece al CD 2024': 'consejo_directivo',
-            'IGJ': 'igj',
-            'AFIP': 'afip',
-            'Estatuto': 'estatuto',
-            'Nómina Actualizada': 'nomina',
-            'Fecha de vencimiento - NÓMINA': 'vencimiento_nomina',
-            'Presidente': 'presidente',
-            'Fecha de vencimiento - PRESIDENTE': 'vencimiento_presidente',
-            'CUIT': 'cuit',
-            'Estado del CUIT': 'estado_cuit',
-            'Provincia': 'provincia',
-            'Localidad': 'localidad',
-            'Dirección': 'direccion'
-        }
+    backend.registrar_login(username)
+    estadisticas.registrar_login(username)
+    auditoria.registrar('autogestion', username, 'login', username)
 
-        # Verificar y mapear columnas
-        existing_columns = {}
-        for original_col in df.columns:
-            for map_col, new_col in columns_map.items():
-                if map_col.lower() == original_col.lower():
-                    existing_columns[original_col] = new_col
-                    break
+# Cookie de sesión. st.context.cookies solo permite leerla, así que se
+# escribe desde el navegador con un componente sin alto.
+COOKIE_SESION = 'came_sesion'
 
-        # Renombrar columnas
-        df = df.rename(columns=existing_columns)
+def leer_cookie_sesion():
+    try:
+        return st.context.cookies.get(COOKIE_SESION)
+    except Exception:
+        # Streamlit sin st.context.cookies: la sesión queda solo en
+        # session_state y el balanceador debe usar sesiones fijas (sticky)
+        return None
 
-        # Limpiar y formatear datos
-        if 'consejo_directivo' in df.columns:
-            df['consejo_directivo'] = df['consejo_directivo'].map({'SI': 'Si', 'NO': 'No'})
-        if 'igj' in df.columns:
-            df['igj'] = df['igj'].map({'SI': 'Si', 'NO': 'No'})
-        if 'afip' in df.columns:
-            df['afip'] = df['afip'].map({'SI': 'Si', 'NO': 'No'})
-        if 'estatuto' in df.columns:
-            df['estatuto'] = df['estatuto'].map({'SI': 'Si', 'NO': 'No'})
-        
-        # Convertir fechas
-        date_columns = ['fecha_ingreso', 'vencimiento_nomina', 'vencimiento_presidente']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
+def escribir_cookie_sesion(valor, duracion):
+    components.html(f"""
+        <script>
+        const seguro = window.parent.location.protocol === 'https:' ? '; Secure' : '';
+        window.parent.document.cookie =
+            '{COOKIE_SESION}={valor}; path=/; max-age={duracion}; SameSite=Strict' + seguro;
+        </script>
+    """, height=0)
 
-        return df
+# Identificador del cliente para el limitador de intentos
+def get_client_id():
+    try:
+        ip = limitador.ip_cliente(
+            st.context.headers.get('X-Forwarded-For'),
+            getattr(st.context, 'ip_address', None)
+        )
+        if ip:
+            return ip
+    except Exception:
+        pass
+    # Sin datos de red se limita solo por entidad: un identificador por
+    # sesión se renueva recargando la página
+    return None
 
+# Funciones de manejo de datos
+def load_data():
+    try:
+        return leer_entidades()
+    except (FileNotFoundError, ValueError) as e:
+        st.error(str(e))
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error general: {str(e)}")
         return pd.DataFrame()
@@ -246,66 +171,33 @@ def save_file(uploaded_file, entity_name, file_type):
         log_path = save_dir / "uploads_log.txt"
         with open(log_path, "a") as log:
             log.write(f"{datetime.datetime.now()}: Subido {file_type} - {file_name}\n")
-            
+        
+        estadisticas.registrar_subida(entity_name, file_type)
+        auditoria.registrar('autogestion', entity_name, 'subir_documento', entity_name,
+                            despues={'tipo': file_type, 'archivo': file_name})
         return True
     return False
 
 def get_user_info(username):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('''
-        SELECT fecha_fundacion, email, telefono, facebook, twitter, instagram, linkedin
-        FROM users WHERE username = ?
-    ''', (username,))
-    result = c.fetchone()
-    conn.close()
-    
-    if result:
-        return {
-            'fecha_fundacion': result[0],
-            'email': result[1],
-            'telefono': result[2],
-            'facebook': result[3],
-            'twitter': result[4],
-            'instagram': result[5],
-            'linkedin': result[6]
-        }
-    return None
+    return perfiles.obtener(
+        estado.canal_usuario(username),
+        lambda: backend.obtener_perfil(username)
+    )
 
 def update_user_info(username, info):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
+    antes = get_user_info(username)
     try:
-        c.execute('''
-            UPDATE users 
-            SET fecha_fundacion = ?,
-                email = ?,
-                telefono = ?,
-                facebook = ?,
-                twitter = ?,
-                instagram = ?,
-                linkedin = ?
-            WHERE username = ?
-        ''', (
-            info['fecha_fundacion'],
-            info['email'],
-            info['telefono'],
-            info['facebook'],
-            info['twitter'],
-            info['instagram'],
-            info['linkedin'],
-            username
-        ))
-        conn.commit()
+        backend.actualizar_perfil(username, info)
+        perfiles.descartar(estado.canal_usuario(username))
+        auditoria.registrar('autogestion', username, 'actualizar_perfil', username, antes, info)
         return True
     except Exception as e:
         print(f"Error updating user info: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 # Inicializar la base de datos
-init_db()
+backend = init_db()
+perfiles = estado.CacheVersionada(backend)
 
 # Inicializar estado de la sesión
 if 'authenticated' not in st.session_state:
@@ -313,6 +205,38 @@ if 'authenticated' not in st.session_state:
 if 'username' not in st.session_state:
     st.session_state.username = None
 
+# La sesión se guarda en el backend y su token en una cookie, así el
+# usuario sigue autenticado aunque el balanceador lo derive a otra réplica.
+# st.context.cookies refleja las cookies de cuando se abrió la página, por
+# eso el token vigente se lleva en session_state y se recuerda la última
+# cookie descartada para no volver a usarla después de cerrar sesión. Se
+# valida en cada ejecución para que un reseteo o baja cierre la sesión en
+# todas las réplicas.
+token = st.session_state.get('token_sesion')
+if not token:
+    cookie = leer_cookie_sesion()
+    if cookie and cookie != st.session_state.get('cookie_descartada'):
+        token = cookie
+if token:
+    username_sesion = backend.obtener_sesion(token)
+    if username_sesion and (not st.session_state.authenticated
+                            or st.session_state.username == username_sesion):
+        st.session_state.authenticated = True
+        st.session_state.username = username_sesion
+        st.session_state.token_sesion = token
+    else:
+        st.session_state.authenticated = False
+        st.session_state.username = None
+        st.session_state.token_sesion = None
+        st.session_state.cookie_descartada = token
+        st.session_state.cookie_pendiente = ('', 0)
+        token = None
+
+# La cookie se escribe en la ejecución siguiente al login o logout, porque
+# st.rerun() corta la ejecución antes de que se envíe el componente
+if 'cookie_pendiente' in st.session_state:
+    escribir_cookie_sesion(*st.session_state.pop('cookie_pendiente'))
+
 # Sistema de Login/Registro
 if not st.session_state.authenticated:
     st.title("Autogestión CAME")
@@ -326,17 +250,23 @@ if not st.session_state.authenticated:
             submit_button = st.form_submit_button("Ingresar")
             
             if submit_button:
-                df = load_data()
-                if username in df['nombre_entidad'].values:
-                    if verify_password(username, password):
-                        st.session_state.authenticated = True
-                        st.session_state.username = username
-                        update_last_login(username)
-                        st.rerun()
-                    else:
-                        st.error("Contraseña incorrecta")
+                if not limitador.permitir_login(username, get_client_id()):
+                    st.error("Demasiados intentos. Espere un minuto e intente nuevamente.")
                 else:
-                    st.error("Entidad no encontrada")
+                    df = load_data()
+                    if username in df['nombre_entidad'].values:
+                        if verify_password(username, password):
+                            st.session_state.authenticated = True
+                            st.session_state.username = username
+                            token = backend.crear_sesion(username)
+                            st.session_state.token_sesion = token
+                            st.session_state.cookie_pendiente = (token, estado.DURACION_SESION)
+                            update_last_login(username)
+                            st.rerun()
+                        else:
+                            st.error("Contraseña incorrecta")
+                    else:
+                        st.error("Entidad no encontrada")
     
     with tab2:
         with st.form("register_form"):
@@ -346,17 +276,20 @@ if not st.session_state.authenticated:
             register_button = st.form_submit_button("Registrarse")
             
             if register_button:
-                df = load_data()
-                if new_username in df['nombre_entidad'].values:
-                    if new_password == confirm_password:
-                        if register_user(new_username, new_password):
-                            st.success("Registro exitoso. Ya puedes iniciar sesión.")
+                if not limitador.permitir_login(new_username, get_client_id()):
+                    st.error("Demasiados intentos. Espere un minuto e intente nuevamente.")
+                else:
+                    df = load_data()
+                    if new_username in df['nombre_entidad'].values:
+                        if new_password == confirm_password:
+                            if register_user(new_username, new_password):
+                                st.success("Registro exitoso. Ya puedes iniciar sesión.")
+                            else:
+                                st.error("La entidad ya está registrada")
                         else:
-                            st.error("La entidad ya está registrada")
+                            st.error("Las contraseñas no coinciden")
                     else:
-                        st.error("Las contraseñas no coinciden")
-                else:
-                    st.error("Entidad no encontrada en nuestros registros")
+                        st.error("Entidad no encontrada en nuestros registros")
 
 # Pantalla principal
 else:
@@ -375,6 +308,11 @@ else:
     
     # Botón de cierre de sesión
     if st.sidebar.button("Cerrar Sesión"):
+        if token:
+            backend.eliminar_sesion(token)
+            st.session_state.cookie_descartada = token
+        st.session_state.token_sesion = None
+        st.session_state.cookie_pendiente = ('', 0)
         st.session_state.authenticated = False
         st.session_state.username = None
         st.rerun()
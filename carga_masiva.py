@@ -0,0 +1,376 @@
+import sqlite3
+import hashlib
+import secrets
+import time
+import argparse
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import estado
+from entidades import leer_entidades, nombres_entidades
+
+# Alta y reseteo masivo de credenciales.
+#
+# El trabajo se guarda primero en tablas auxiliares (carga_masiva_trabajos y
+# carga_masiva_items). El hasheo se reparte en un pool de procesos y cada lote
+# hasheado queda persistido, por lo que si el proceso se interrumpe se retoma
+# desde el último lote guardado. Al terminar, todas las credenciales se
+# aplican con una sola llamada al backend de estado (estado.py), que las
+# escribe en una única transacción junto con un evento de auditoría por
+# usuario afectado; así la carga funciona igual con la base local que con
+# servidor_estado.py. Después se marcan los items aplicados. Si el proceso se
+# corta entre los dos pasos, al reanudar se vuelve a aplicar: el backend
+# reconoce las credenciales que ya tiene.
+
+MODOS = ('alta', 'reseteo')
+ITERACIONES = 100000
+TAM_LOTE = 100
+# Horas que se conservan las contraseñas generadas sin descargar
+CADUCIDAD_CREDENCIALES = 24
+
+def init_tablas(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS carga_masiva_trabajos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            modo TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            total INTEGER NOT NULL,
+            aplicados INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS carga_masiva_items (
+            trabajo_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            password TEXT,
+            generada INTEGER NOT NULL DEFAULT 0,
+            password_hash TEXT,
+            salt TEXT,
+            aplicado INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (trabajo_id, username)
+        )
+    ''')
+    # Bases creadas antes de agregar la columna aplicado
+    columnas = [col[1] for col in c.execute('PRAGMA table_info(carga_masiva_items)').fetchall()]
+    if 'aplicado' not in columnas:
+        c.execute('ALTER TABLE carga_masiva_items ADD COLUMN aplicado INTEGER NOT NULL DEFAULT 0')
+    conn.commit()
+
+def caducar_credenciales(conn):
+    # Las contraseñas en claro de trabajos aplicados hace más de
+    # CADUCIDAD_CREDENCIALES horas se borran aunque nadie las haya descargado.
+    # Los hashes de trabajos aplicados antes de que se borraran al aplicar
+    # también se limpian acá.
+    with conn:
+        conn.execute('''
+            UPDATE carga_masiva_items SET password_hash = NULL, salt = NULL
+            WHERE password_hash IS NOT NULL AND trabajo_id IN (
+                SELECT id FROM carga_masiva_trabajos WHERE estado = 'aplicado'
+            )
+        ''')
+        conn.execute('''
+            UPDATE carga_masiva_items SET password = NULL
+            WHERE password IS NOT NULL AND trabajo_id IN (
+                SELECT id FROM carga_masiva_trabajos
+                WHERE estado = 'aplicado' AND finished_at < datetime('now', ?)
+            )
+        ''', (f'-{CADUCIDAD_CREDENCIALES} hours',))
+
+# Se ejecuta en los procesos del pool: debe ser una función de módulo
+def _hashear(item):
+    username, password = item
+    salt = secrets.token_hex(16)
+    hash_obj = hashlib.pbkdf2_hmac(
+        'sha256',
+        password.encode('utf-8'),
+        salt.encode('utf-8'),
+        ITERACIONES
+    )
+    return username, hash_obj.hex(), salt
+
+def generar_password():
+    return secrets.token_urlsafe(9)
+
+def leer_nombres_csv(archivo):
+    # Acepta una ruta o un archivo subido con st.file_uploader
+    if hasattr(archivo, 'getvalue'):
+        data = archivo.getvalue()
+    else:
+        with open(archivo, 'rb') as f:
+            data = f.read()
+
+    df = None
+    for encoding in ['utf-8-sig', 'latin1']:
+        try:
+            df = pd.read_csv(io.BytesIO(data), encoding=encoding, sep=None,
+                             engine='python', dtype=str)
+            break
+        except Exception:
+            continue
+
+    if df is None or df.empty:
+        return []
+
+    df.columns = df.columns.str.strip().str.lower()
+    nombre_col = next((c for c in df.columns if c in ('entidad', 'nombre_entidad', 'username')),
+                      df.columns[0])
+    password_col = next((c for c in df.columns if c in ('contraseña', 'password')), None)
+
+    credenciales = {}
+    for _, row in df.iterrows():
+        nombre = row[nombre_col]
+        if pd.isna(nombre) or not str(nombre).strip():
+            continue
+        password = row[password_col] if password_col else None
+        credenciales[str(nombre).strip()] = None if pd.isna(password) or password == '' else password
+    return list(credenciales.items())
+
+def filtrar_padron(credenciales, nombres_validos):
+    # Separa las entidades del CSV que no figuran en el padrón: no podrían
+    # iniciar sesión aunque se les cree un usuario
+    nombres_validos = set(nombres_validos)
+    validas = [(u, p) for u, p in credenciales if u in nombres_validos]
+    desconocidas = [u for u, _ in credenciales if u not in nombres_validos]
+    return validas, desconocidas
+
+def usuarios_registrados(db_path):
+    return [u['username'] for u in estado.obtener_backend(db_path, rol='admin').listar_usuarios()]
+
+def entidades_sin_registrar(db_path, nombres):
+    registrados = set(usuarios_registrados(db_path))
+    return [n for n in nombres if n not in registrados]
+
+def crear_trabajo(db_path, modo, credenciales, password=None):
+    # credenciales: lista de (username, password); si la contraseña es None
+    # se usa la contraseña común indicada o se genera una por entidad
+    if modo not in MODOS:
+        raise ValueError(f"Modo inválido: {modo}")
+
+    items = []
+    for username, user_password in credenciales:
+        if user_password is None:
+            user_password = password
+        if user_password is None:
+            items.append((username, generar_password(), 1))
+        else:
+            items.append((username, user_password, 0))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        with conn:
+            c = conn.cursor()
+            c.execute(
+                'INSERT INTO carga_masiva_trabajos (modo, total) VALUES (?, ?)',
+                (modo, len(items))
+            )
+            trabajo_id = c.lastrowid
+            c.executemany(
+                'INSERT OR IGNORE INTO carga_masiva_items (trabajo_id, username, password, generada) VALUES (?, ?, ?, ?)',
+                [(trabajo_id, u, p, g) for u, p, g in items]
+            )
+        return trabajo_id
+    finally:
+        conn.close()
+
+def trabajos_pendientes(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        caducar_credenciales(conn)
+        c = conn.cursor()
+        c.execute('''
+            SELECT t.id, t.modo, t.total, COUNT(i.password_hash), t.created_at
+            FROM carga_masiva_trabajos t
+            LEFT JOIN carga_masiva_items i ON i.trabajo_id = t.id
+            WHERE t.estado != 'aplicado'
+            GROUP BY t.id
+            ORDER BY t.id
+        ''')
+        return [
+            {'id': r[0], 'modo': r[1], 'total': r[2], 'hasheados': r[3], 'created_at': r[4]}
+            for r in c.fetchall()
+        ]
+    finally:
+        conn.close()
+
+def ejecutar_trabajo(db_path, trabajo_id, on_progress=None, workers=None, tam_lote=TAM_LOTE):
+    backend = estado.obtener_backend(db_path, rol='admin')
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        c = conn.cursor()
+        c.execute('SELECT modo, estado, total FROM carga_masiva_trabajos WHERE id = ?', (trabajo_id,))
+        trabajo = c.fetchone()
+        if trabajo is None:
+            raise ValueError(f"No existe el trabajo {trabajo_id}")
+        modo, estado_trabajo, total = trabajo
+
+        resumen = {'total': total, 'hasheados': 0, 'aplicados': 0, 'segundos': 0.0, 'por_segundo': 0.0}
+        if estado_trabajo == 'aplicado':
+            return resumen
+
+        # Solo se hashean los items que quedaron pendientes de una corrida anterior
+        c.execute('''
+            SELECT username, password FROM carga_masiva_items
+            WHERE trabajo_id = ? AND password_hash IS NULL
+            ORDER BY username
+        ''', (trabajo_id,))
+        pendientes = c.fetchall()
+        procesados = total - len(pendientes)
+
+        inicio = time.perf_counter()
+        if pendientes:
+            workers = workers or os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for i in range(0, len(pendientes), tam_lote):
+                    lote = pendientes[i:i + tam_lote]
+                    chunksize = max(1, len(lote) // (workers * 4))
+                    hasheados = list(pool.map(_hashear, lote, chunksize=chunksize))
+
+                    # Checkpoint del lote; la contraseña en claro solo se
+                    # conserva si fue generada, para poder entregarla
+                    with conn:
+                        conn.executemany('''
+                            UPDATE carga_masiva_items
+                            SET password_hash = ?, salt = ?,
+                                password = CASE WHEN generada = 1 THEN password ELSE NULL END
+                            WHERE trabajo_id = ? AND username = ?
+                        ''', [(h, s, trabajo_id, u) for u, h, s in hasheados])
+
+                    procesados += len(lote)
+                    resumen['hasheados'] += len(lote)
+                    segundos = time.perf_counter() - inicio
+                    if on_progress:
+                        on_progress(procesados, total, resumen['hasheados'] / segundos if segundos else 0.0)
+
+        # Aplicar todo en una sola transacción del backend
+        c.execute('''
+            SELECT username, password_hash, salt FROM carga_masiva_items
+            WHERE trabajo_id = ?
+        ''', (trabajo_id,))
+        afectados = backend.aplicar_credenciales(modo, c.fetchall(), trabajo_id)
+        with conn:
+            # Solo los items aplicados conservan la contraseña generada
+            c.executemany(
+                'UPDATE carga_masiva_items SET aplicado = 1 WHERE trabajo_id = ? AND username = ?',
+                [(trabajo_id, u) for u in afectados]
+            )
+            c.execute(
+                'UPDATE carga_masiva_items SET password = NULL WHERE trabajo_id = ? AND aplicado = 0',
+                (trabajo_id,)
+            )
+            # Los hashes solo hacen falta para reanudar; ya están en users
+            c.execute(
+                'UPDATE carga_masiva_items SET password_hash = NULL, salt = NULL WHERE trabajo_id = ?',
+                (trabajo_id,)
+            )
+            resumen['aplicados'] = len(afectados)
+            c.execute('''
+                UPDATE carga_masiva_trabajos
+                SET estado = 'aplicado', aplicados = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (resumen['aplicados'], trabajo_id))
+
+        resumen['segundos'] = time.perf_counter() - inicio
+        if resumen['hasheados'] and resumen['segundos']:
+            resumen['por_segundo'] = resumen['hasheados'] / resumen['segundos']
+        return resumen
+    finally:
+        conn.close()
+
+def trabajos_por_entregar(db_path):
+    # Trabajos aplicados con contraseñas generadas que todavía no se
+    # descargaron ni caducaron
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        caducar_credenciales(conn)
+        c = conn.cursor()
+        c.execute('''
+            SELECT t.id, t.modo, COUNT(*), t.finished_at
+            FROM carga_masiva_trabajos t
+            JOIN carga_masiva_items i ON i.trabajo_id = t.id
+            WHERE t.estado = 'aplicado' AND i.generada = 1 AND i.aplicado = 1
+              AND i.password IS NOT NULL
+            GROUP BY t.id
+            ORDER BY t.id
+        ''')
+        return [
+            {'id': r[0], 'modo': r[1], 'credenciales': r[2], 'finished_at': r[3]}
+            for r in c.fetchall()
+        ]
+    finally:
+        conn.close()
+
+def credenciales_generadas(db_path, trabajo_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        caducar_credenciales(conn)
+        c = conn.cursor()
+        c.execute('''
+            SELECT username, password FROM carga_masiva_items
+            WHERE trabajo_id = ? AND generada = 1 AND aplicado = 1 AND password IS NOT NULL
+            ORDER BY username
+        ''', (trabajo_id,))
+        return c.fetchall()
+    finally:
+        conn.close()
+
+def descartar_credenciales(db_path, trabajo_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        with conn:
+            conn.execute(
+                'UPDATE carga_masiva_items SET password = NULL WHERE trabajo_id = ?',
+                (trabajo_id,)
+            )
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Alta y reseteo masivo de credenciales")
+    parser.add_argument('modo', choices=MODOS)
+    parser.add_argument('--db', default='users.db')
+    parser.add_argument('--csv', help="CSV con nombres de entidad (y opcionalmente contraseña)")
+    parser.add_argument('--password', help="Contraseña común; si se omite se generan")
+    parser.add_argument('--reanudar', type=int, help="ID de un trabajo interrumpido")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--salida', default='credenciales_generadas.csv')
+    args = parser.parse_args()
+
+    if args.reanudar:
+        trabajo_id = args.reanudar
+    else:
+        nombres = nombres_entidades(leer_entidades())
+        if args.csv:
+            credenciales, desconocidas = filtrar_padron(leer_nombres_csv(args.csv), nombres)
+            for nombre in desconocidas:
+                print(f"No figura en el padrón, se omite: {nombre}")
+        else:
+            if args.modo == 'alta':
+                nombres = entidades_sin_registrar(args.db, nombres)
+            credenciales = [(n, None) for n in nombres]
+        trabajo_id = crear_trabajo(args.db, args.modo, credenciales, args.password)
+        print(f"Trabajo {trabajo_id} creado con {len(credenciales)} entidades")
+
+    def mostrar(procesados, total, por_segundo):
+        print(f"{procesados}/{total} hasheados ({por_segundo:.1f}/s)")
+
+    resumen = ejecutar_trabajo(args.db, trabajo_id, mostrar, args.workers)
+    print(f"Aplicados: {resumen['aplicados']} de {resumen['total']} en {resumen['segundos']:.1f}s")
+
+    generadas = credenciales_generadas(args.db, trabajo_id)
+    if generadas:
+        pd.DataFrame(generadas, columns=['Entidad', 'Contraseña']).to_csv(args.salida, index=False)
+        descartar_credenciales(args.db, trabajo_id)
+        print(f"Credenciales generadas guardadas en {args.salida}")
+
+if __name__ == '__main__':
+    main()
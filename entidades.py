@@ -0,0 +1,194 @@
+import pandas as pd
+import os
+import hashlib
+import threading
+import unicodedata
+import datetime
+
+# Archivo con el padrón de entidades
+ENTIDADES_CSV = 'datos_entidades.csv'
+
+# Mapeo de columnas del CSV a nombres internos
+COLUMNS_MAP = {
+    'Entidad': 'nombre_entidad',
+    'Sigla': 'sigla',
+    'Fecha de Ingreso': 'fecha_ingreso',
+    'Pertenece al CD 2024': 'consejo_directivo',
+    'IGJ': 'igj',
+    'AFIP': 'afip',
+    'Estatuto': 'estatuto',
+    'Nómina Actualizada': 'nomina',
+    'Fecha de vencimiento - NÓMINA': 'vencimiento_nomina',
+    'Presidente': 'presidente',
+    'Fecha de vencimiento - PRESIDENTE': 'vencimiento_presidente',
+    'CUIT': 'cuit',
+    'Estado del CUIT': 'estado_cuit',
+    'Provincia': 'provincia',
+    'Localidad': 'localidad',
+    'Dirección': 'direccion'
+}
+
+# Lectura del padrón sin depender de Streamlit, para poder usarla
+# desde la app, el panel administrativo y los procesos en segundo plano
+def leer_entidades(file_path=ENTIDADES_CSV):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"No se encontró el archivo {file_path}")
+
+    # Lista de encodings a intentar
+    encodings = ['latin1', 'iso-8859-1', 'cp1252', 'utf-8-sig', 'utf-8']
+    separators = [';', ',', '\t']
+
+    df = None
+
+    # Probar diferentes combinaciones de codificación y separador
+    for encoding in encodings:
+        if df is not None:
+            break
+        for sep in separators:
+            try:
+                df = pd.read_csv(file_path,
+                               encoding=encoding,
+                               sep=sep,
+                               on_bad_lines='skip')
+                break
+            except Exception:
+                continue
+
+    if df is None:
+        raise ValueError("No se pudo leer el archivo con ninguna combinación de codificación y separador")
+
+    # Limpiar nombres de columnas
+    df.columns = df.columns.str.strip()
+
+    # Verificar y mapear columnas
+    existing_columns = {}
+    for original_col in df.columns:
+        for map_col, new_col in COLUMNS_MAP.items():
+            if map_col.lower() == original_col.lower():
+                existing_columns[original_col] = new_col
+                break
+
+    # Renombrar columnas
+    df = df.rename(columns=existing_columns)
+
+    # Limpiar y formatear datos
+    for col in ['consejo_directivo', 'igj', 'afip', 'estatuto']:
+        if col in df.columns:
+            df[col] = df[col].map({'SI': 'Si', 'NO': 'No'})
+
+    # Convertir fechas
+    date_columns = ['fecha_ingreso', 'vencimiento_nomina', 'vencimiento_presidente']
+    for col in date_columns:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
+
+    return df
+
+def nombres_entidades(df):
+    if 'nombre_entidad' not in df.columns:
+        return []
+    nombres = df['nombre_entidad'].dropna().astype(str).str.strip()
+    return list(dict.fromkeys(n for n in nombres if n))
+
+def normalizar_nombre(nombre):
+    # Minúsculas, sin acentos y con espacios colapsados
+    texto = unicodedata.normalize('NFKD', str(nombre))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+def normalizar_cuit(cuit):
+    if cuit is None or (isinstance(cuit, float) and pd.isna(cuit)):
+        return None
+    if isinstance(cuit, float):
+        cuit = int(cuit)
+    digitos = ''.join(c for c in str(cuit) if c.isdigit())
+    # Un CUIT tiene 11 dígitos; el padrón usa 0 y otros valores de relleno
+    return digitos if len(digitos) == 11 else None
+
+def _valor(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if isinstance(valor, (pd.Timestamp, datetime.date)):
+        return valor.strftime('%Y-%m-%d')
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return valor
+
+def _vencida(fecha, hoy):
+    if fecha is None or pd.isna(fecha):
+        return None
+    return fecha.date() < hoy
+
+def estado_cumplimiento(row, hoy=None):
+    hoy = hoy or datetime.date.today()
+    return {
+        'cuit': {
+            'numero': normalizar_cuit(row.get('cuit')),
+            'estado': _valor(row.get('estado_cuit')),
+            'ok': row.get('estado_cuit') == 'OK'
+        },
+        'nomina': {
+            'estado': _valor(row.get('nomina')),
+            'vencimiento': _valor(row.get('vencimiento_nomina')),
+            'vencida': _vencida(row.get('vencimiento_nomina'), hoy)
+        },
+        'presidente': {
+            'nombre': _valor(row.get('presidente')),
+            'vencimiento': _valor(row.get('vencimiento_presidente')),
+            'vencido': _vencida(row.get('vencimiento_presidente'), hoy)
+        },
+        'estatuto': "Enviado" if row.get('estatuto') == "Si" else "Pendiente",
+        'igj': "Enviado" if row.get('igj') == "Si" else "Pendiente",
+        'afip': "Enviado" if row.get('afip') == "Si" else "Pendiente"
+    }
+
+def registro_entidad(row, hoy=None):
+    registro = {col: _valor(row.get(col)) for col in COLUMNS_MAP.values() if col in row}
+    registro['cuit'] = normalizar_cuit(row.get('cuit'))
+    registro['cumplimiento'] = estado_cumplimiento(row, hoy)
+    return registro
+
+# Snapshot en memoria del padrón. Se reconstruye solo cuando cambia el archivo
+# y su versión es un hash del contenido, así procesos distintos que leen el
+# mismo CSV obtienen la misma versión.
+class SnapshotEntidades:
+    def __init__(self, df, version, clave):
+        self.df = df
+        self.version = version
+        self.clave = clave
+        self.por_cuit = {}
+        self.por_nombre = {}
+        for idx, cuit, nombre in zip(df.index,
+                                     df.get('cuit', pd.Series(index=df.index, dtype=object)),
+                                     df.get('nombre_entidad', pd.Series(index=df.index, dtype=object))):
+            cuit = normalizar_cuit(cuit)
+            if cuit:
+                self.por_cuit.setdefault(cuit, []).append(idx)
+            if isinstance(nombre, str) and nombre.strip():
+                self.por_nombre.setdefault(normalizar_nombre(nombre), idx)
+
+    def buscar_cuit(self, cuit):
+        # Devuelve todas las filas con ese CUIT: el padrón tiene CUITs repetidos
+        return [self.df.loc[idx] for idx in self.por_cuit.get(normalizar_cuit(cuit), [])]
+
+    def buscar_nombre(self, nombre):
+        idx = self.por_nombre.get(normalizar_nombre(nombre))
+        return None if idx is None else self.df.loc[idx]
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def obtener_snapshot(file_path=ENTIDADES_CSV):
+    global _snapshot
+    stat = os.stat(file_path)
+    clave = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.clave == clave:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.clave != clave:
+            with open(file_path, 'rb') as f:
+                version = hashlib.sha1(f.read()).hexdigest()[:16]
+            _snapshot = SnapshotEntidades(leer_entidades(file_path), version, clave)
+        return _snapshot
@@ -0,0 +1,249 @@
+import sqlite3
+import os
+import datetime
+import pandas as pd
+import estado
+from entidades import obtener_snapshot
+
+# Cubo de estadísticas por ubicación.
+#
+# estadisticas_cubo guarda la cantidad de entidades por
+# provincia × localidad × estado de nómina × documentación × registrada × activa.
+# Se reconstruye con cada versión del padrón (o una vez por día, porque
+# "activa" depende de la fecha) y se actualiza de a una celda cuando una
+# entidad se registra, inicia sesión o sube un documento. estadisticas_entidades
+# guarda la celda en la que está cada entidad para poder moverla.
+#
+# Las tablas viven en la base del backend de estado (estado.py), junto a
+# users: registrar_*, marcar_desactualizado y consultar_cubo le delegan la
+# operación, así todas las réplicas mueven y leen un único cubo. Las
+# funciones con guion bajo son las que el backend ejecuta sobre su base.
+
+DIMENSIONES = ['provincia', 'localidad', 'nomina', 'documentacion', 'registrada', 'activa']
+DOCUMENTOS = ['nomina', 'estatuto', 'igj', 'afip']
+DIAS_ACTIVA = 30
+SIN_DATO = "Sin dato"
+
+def init_tablas(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas_cubo (
+            provincia TEXT NOT NULL,
+            localidad TEXT NOT NULL,
+            nomina TEXT NOT NULL,
+            documentacion TEXT NOT NULL,
+            registrada INTEGER NOT NULL,
+            activa INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            PRIMARY KEY (provincia, localidad, nomina, documentacion, registrada, activa)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas_entidades (
+            username TEXT PRIMARY KEY,
+            provincia TEXT NOT NULL,
+            localidad TEXT NOT NULL,
+            nomina TEXT NOT NULL,
+            faltantes TEXT NOT NULL,
+            subidos TEXT NOT NULL,
+            documentacion TEXT NOT NULL,
+            registrada INTEGER NOT NULL,
+            activa INTEGER NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas_meta (
+            clave TEXT PRIMARY KEY,
+            valor TEXT
+        )
+    ''')
+    conn.commit()
+
+def _documentacion(faltantes, subidos):
+    if not faltantes:
+        return "Completa"
+    if faltantes <= subidos:
+        return "En revisión"
+    return "Incompleta"
+
+def _subidos(entidad, uploads_dir):
+    path = os.path.join(uploads_dir, entidad)
+    if not os.path.isdir(path):
+        return set()
+    return {f.split('_')[0] for f in os.listdir(path) if f.split('_')[0] in DOCUMENTOS}
+
+def _unir(valores):
+    return ','.join(sorted(valores))
+
+def _separar(texto):
+    return set(texto.split(',')) if texto else set()
+
+def reconstruir_cubo(db_path='users.db', uploads_dir='uploads'):
+    snapshot = obtener_snapshot()
+    df = snapshot.df
+    if 'nombre_entidad' not in df.columns:
+        return
+    df = df[df['nombre_entidad'].notna()].drop_duplicates('nombre_entidad').copy()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        users = pd.read_sql('SELECT username, last_login FROM users', conn)
+        limite = pd.Timestamp.now() - pd.Timedelta(days=DIAS_ACTIVA)
+        last_login = pd.to_datetime(users['last_login'], errors='coerce')
+        registrados = set(users['username'])
+        activos = set(users.loc[last_login >= limite, 'username'])
+
+        datos = pd.DataFrame({'username': df['nombre_entidad'].astype(str)})
+        for col in ['provincia', 'localidad', 'nomina']:
+            valores = df[col] if col in df.columns else pd.Series(index=df.index, dtype=object)
+            datos[col] = valores.fillna(SIN_DATO).astype(str).str.strip().replace('', SIN_DATO)
+
+        # Documentos faltantes según el padrón
+        falta = pd.DataFrame({'nomina': datos['nomina'] != 'Vigente'})
+        for doc in ['estatuto', 'igj', 'afip']:
+            falta[doc] = df[doc] != 'Si' if doc in df.columns else True
+        faltantes = [{d for d in DOCUMENTOS if fila[d]} for fila in falta.to_dict('records')]
+        # Las subidas ya registradas se conservan: los archivos pueden estar
+        # en el disco de otra réplica
+        previos = dict(conn.execute('SELECT username, subidos FROM estadisticas_entidades').fetchall())
+        subidos = [_subidos(u, uploads_dir) | _separar(previos.get(u)) for u in datos['username']]
+
+        datos['faltantes'] = [_unir(f) for f in faltantes]
+        datos['subidos'] = [_unir(s) for s in subidos]
+        datos['documentacion'] = [_documentacion(f, s) for f, s in zip(faltantes, subidos)]
+        datos['registrada'] = datos['username'].isin(registrados).astype(int)
+        datos['activa'] = datos['username'].isin(activos).astype(int)
+
+        cubo = datos.groupby(DIMENSIONES).size().reset_index(name='cantidad')
+
+        with conn:
+            conn.execute('DELETE FROM estadisticas_cubo')
+            conn.execute('DELETE FROM estadisticas_entidades')
+            conn.executemany(
+                'INSERT INTO estadisticas_cubo VALUES (?, ?, ?, ?, ?, ?, ?)',
+                cubo.itertuples(index=False, name=None)
+            )
+            conn.executemany(
+                'INSERT INTO estadisticas_entidades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                datos[['username', 'provincia', 'localidad', 'nomina', 'faltantes',
+                       'subidos', 'documentacion', 'registrada', 'activa']].itertuples(index=False, name=None)
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO estadisticas_meta VALUES (?, ?)',
+                [('version', snapshot.version), ('fecha', datetime.date.today().isoformat())]
+            )
+    finally:
+        conn.close()
+
+def asegurar_cubo(db_path='users.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        meta = dict(conn.execute('SELECT clave, valor FROM estadisticas_meta').fetchall())
+    finally:
+        conn.close()
+    if (meta.get('version') != obtener_snapshot().version
+            or meta.get('fecha') != datetime.date.today().isoformat()):
+        reconstruir_cubo(db_path)
+
+def _marcar_desactualizado(db_path='users.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        with conn:
+            conn.execute("DELETE FROM estadisticas_meta WHERE clave = 'version'")
+    finally:
+        conn.close()
+
+def _actualizar_entidad(db_path, username, cambios, subido=None):
+    # Mueve la entidad de su celda actual a la nueva. La lectura de la celda
+    # actual y la escritura van en la misma transacción (BEGIN IMMEDIATE) para
+    # que dos procesos no descuenten dos veces la misma celda. Los errores no
+    # deben interrumpir el login ni la subida de archivos.
+    try:
+        conn = sqlite3.connect(db_path, timeout=10)
+        try:
+            init_tablas(conn)
+            conn.isolation_level = None
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                c = conn.cursor()
+                c.execute('SELECT * FROM estadisticas_entidades WHERE username = ?', (username,))
+                row = c.fetchone()
+                if row is None:
+                    conn.execute('ROLLBACK')
+                    return
+                actual = dict(zip([d[0] for d in c.description], row))
+                nuevo = dict(actual)
+                nuevo.update(cambios)
+                if subido:
+                    nuevo['subidos'] = _unir(_separar(actual['subidos']) | {subido})
+                nuevo['documentacion'] = _documentacion(_separar(nuevo['faltantes']), _separar(nuevo['subidos']))
+
+                celda_actual = tuple(actual[d] for d in DIMENSIONES)
+                celda_nueva = tuple(nuevo[d] for d in DIMENSIONES)
+                if celda_actual != celda_nueva:
+                    conn.execute('''
+                        UPDATE estadisticas_cubo SET cantidad = cantidad - 1
+                        WHERE provincia = ? AND localidad = ? AND nomina = ?
+                          AND documentacion = ? AND registrada = ? AND activa = ?
+                    ''', celda_actual)
+                    conn.execute('DELETE FROM estadisticas_cubo WHERE cantidad <= 0')
+                    conn.execute('''
+                        INSERT INTO estadisticas_cubo VALUES (?, ?, ?, ?, ?, ?, 1)
+                        ON CONFLICT (provincia, localidad, nomina, documentacion, registrada, activa)
+                        DO UPDATE SET cantidad = cantidad + 1
+                    ''', celda_nueva)
+                if nuevo != actual:
+                    conn.execute('''
+                        UPDATE estadisticas_entidades
+                        SET subidos = ?, documentacion = ?, registrada = ?, activa = ?
+                        WHERE username = ?
+                    ''', (nuevo['subidos'], nuevo['documentacion'], nuevo['registrada'],
+                          nuevo['activa'], username))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Error actualizando estadísticas: {str(e)}")
+
+def _leer_cubo(db_path='users.db'):
+    asegurar_cubo(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql('SELECT * FROM estadisticas_cubo', conn)
+    finally:
+        conn.close()
+
+def _mover(db_path, rol, username, cambios, subido=None):
+    # Como _actualizar_entidad, un backend caído no debe interrumpir el
+    # login ni la subida de archivos
+    try:
+        estado.obtener_backend(db_path, rol=rol).mover_entidad(username, cambios, subido)
+    except Exception as e:
+        print(f"Error actualizando estadísticas: {str(e)}")
+
+def registrar_alta(username, db_path='users.db', rol='app'):
+    _mover(db_path, rol, username, {'registrada': 1})
+
+def registrar_baja(username, db_path='users.db', rol='app'):
+    _mover(db_path, rol, username, {'registrada': 0, 'activa': 0})
+
+def registrar_login(username, db_path='users.db', rol='app'):
+    _mover(db_path, rol, username, {'registrada': 1, 'activa': 1})
+
+def registrar_subida(username, file_type, db_path='users.db', rol='app'):
+    _mover(db_path, rol, username, {}, subido=file_type)
+
+def marcar_desactualizado(db_path='users.db', rol='admin'):
+    estado.obtener_backend(db_path, rol=rol).marcar_cubo_desactualizado()
+
+def consultar_cubo(db_path='users.db', rol='admin'):
+    return pd.DataFrame(
+        estado.obtener_backend(db_path, rol=rol).consultar_cubo(),
+        columns=DIMENSIONES + ['cantidad']
+    )
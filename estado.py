@@ -0,0 +1,528 @@
+import sqlite3
+import secrets
+import hashlib
+import json
+import threading
+import time
+import os
+import datetime
+from collections import OrderedDict
+from urllib import request as urlrequest, error as urlerror
+import auditoria
+import estadisticas
+import limitador
+
+# Backend de estado compartido: usuarios, tokens de sesión, señales de
+# invalidación de caché, y también el registro de auditoría, el cubo de
+# estadísticas y el limitador de intentos de login, para que todas las
+# réplicas escriban y lean los mismos datos.
+#
+# EstadoSQLite trabaja directo sobre la base (en modo WAL y con espera ante
+# bloqueos, para que varios procesos puedan usarla a la vez). EstadoHTTP
+# delega todas las operaciones en servidor_estado.py, de modo que varias
+# réplicas de la app comparten el mismo estado sin compartir el archivo.
+#
+# Se elige con la variable de entorno ESTADO_BACKEND: una URL http(s) usa
+# EstadoHTTP; si no, se usa EstadoSQLite sobre ESTADO_DB, que tiene
+# prioridad sobre la base que indique quien llama (el panel y los procesos
+# de línea de comandos pasan la suya), así la app y las herramientas
+# administrativas ven la misma tabla users. Sin ESTADO_DB se usa la base
+# indicada o users.db. Cada cliente HTTP se identifica con el token de su
+# rol: ESTADO_TOKEN para la app y ESTADO_TOKEN_ADMIN para el panel y los
+# procesos administrativos.
+#
+# Detrás de un balanceador, PROXIES_CONFIABLES (limitador.py) debe indicar
+# cuántos proxies propios agregan X-Forwarded-For; con el valor por defecto
+# (0) todas las réplicas ven la IP del balanceador y todos los usuarios
+# comparten un mismo límite por cliente.
+
+DURACION_SESION = 8 * 3600
+CAMPOS_PERFIL = ['fecha_fundacion', 'email', 'telefono', 'facebook', 'twitter', 'instagram', 'linkedin']
+# Datos de cada usuario que ven el panel y los procesos administrativos
+CAMPOS_USUARIO = ['username', 'created_at', 'last_login', 'fecha_fundacion', 'email', 'telefono']
+
+# Operaciones expuestas por servidor_estado.py
+METODOS = [
+    'obtener_credenciales', 'crear_usuario', 'actualizar_password', 'eliminar_usuario',
+    'registrar_login', 'obtener_perfil', 'actualizar_perfil',
+    'listar_usuarios', 'obtener_usuario', 'aplicar_credenciales',
+    'crear_sesion', 'obtener_sesion', 'eliminar_sesion',
+    'invalidar', 'version',
+    'registrar_auditoria', 'consultar_auditoria',
+    'mover_entidad', 'consultar_cubo', 'marcar_cubo_desactualizado',
+    'permitir_intento', 'registrar_costo_hash', 'contadores_limitador'
+]
+
+# Operaciones permitidas a cada rol en servidor_estado.py
+PERMISOS = {
+    'app': [
+        'obtener_credenciales', 'crear_usuario', 'registrar_login',
+        'obtener_perfil', 'actualizar_perfil',
+        'crear_sesion', 'obtener_sesion', 'eliminar_sesion', 'version',
+        'registrar_auditoria', 'mover_entidad', 'permitir_intento', 'registrar_costo_hash'
+    ],
+    'admin': METODOS
+}
+TOKENS_ROL = {'app': 'ESTADO_TOKEN', 'admin': 'ESTADO_TOKEN_ADMIN'}
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def canal_usuario(username):
+    return f'usuario:{username}'
+
+def _fecha(valor):
+    # Por HTTP las fechas viajan en formato ISO
+    return datetime.date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+def backend_compartido():
+    return (os.environ.get('ESTADO_BACKEND', '').startswith(('http://', 'https://'))
+            or bool(os.environ.get('ESTADO_DB')))
+
+class EstadoSQLite:
+    def __init__(self, db_path='users.db'):
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            c = conn.cursor()
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password_hash TEXT NOT NULL,
+                    salt TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_login TIMESTAMP,
+                    fecha_fundacion DATE,
+                    email TEXT,
+                    telefono TEXT,
+                    facebook TEXT,
+                    twitter TEXT,
+                    instagram TEXT,
+                    linkedin TEXT
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS sesiones (
+                    token_hash TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_username ON sesiones (username)')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS invalidaciones (
+                    canal TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+            auditoria.init_tablas(conn)
+        finally:
+            conn.close()
+        self._limitador = limitador.LimitadorSQLite(db_path)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _invalidar(self, conn, canal):
+        conn.execute('''
+            INSERT INTO invalidaciones VALUES (?, 1)
+            ON CONFLICT (canal) DO UPDATE SET version = version + 1
+        ''', (canal,))
+
+    # Usuarios
+    def obtener_credenciales(self, username):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT password_hash, salt FROM users WHERE username = ?', (username,)
+            ).fetchone()
+            return list(row) if row else None
+        finally:
+            conn.close()
+
+    def crear_usuario(self, username, password_hash, salt):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT INTO users (username, password_hash, salt, created_at) VALUES (?, ?, ?, datetime("now"))',
+                    (username, password_hash, salt)
+                )
+                self._invalidar(conn, canal_usuario(username))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            conn.close()
+
+    def actualizar_password(self, username, password_hash, salt):
+        # Cambiar la contraseña cierra todas las sesiones del usuario
+        conn = self._connect()
+        try:
+            with conn:
+                c = conn.execute(
+                    'UPDATE users SET password_hash = ?, salt = ? WHERE username = ?',
+                    (password_hash, salt, username)
+                )
+                conn.execute('DELETE FROM sesiones WHERE username = ?', (username,))
+            return c.rowcount > 0
+        finally:
+            conn.close()
+
+    def eliminar_usuario(self, username):
+        conn = self._connect()
+        try:
+            with conn:
+                c = conn.execute('DELETE FROM users WHERE username = ?', (username,))
+                conn.execute('DELETE FROM sesiones WHERE username = ?', (username,))
+                self._invalidar(conn, canal_usuario(username))
+            return c.rowcount > 0
+        finally:
+            conn.close()
+
+    def registrar_login(self, username):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?',
+                    (username,)
+                )
+        finally:
+            conn.close()
+
+    def obtener_perfil(self, username):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(CAMPOS_PERFIL)} FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            return dict(zip(CAMPOS_PERFIL, row)) if row else None
+        finally:
+            conn.close()
+
+    def actualizar_perfil(self, username, info):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"UPDATE users SET {', '.join(f'{campo} = ?' for campo in CAMPOS_PERFIL)} WHERE username = ?",
+                    [info[campo] for campo in CAMPOS_PERFIL] + [username]
+                )
+                self._invalidar(conn, canal_usuario(username))
+            return True
+        finally:
+            conn.close()
+
+    def listar_usuarios(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(CAMPOS_USUARIO)} FROM users ORDER BY created_at DESC"
+            ).fetchall()
+            return [dict(zip(CAMPOS_USUARIO, row)) for row in rows]
+        finally:
+            conn.close()
+
+    def obtener_usuario(self, username):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(CAMPOS_USUARIO)} FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            return dict(zip(CAMPOS_USUARIO, row)) if row else None
+        finally:
+            conn.close()
+
+    def aplicar_credenciales(self, modo, filas, trabajo_id=None):
+        # Alta ('alta') o reseteo ('reseteo') masivo en una sola transacción.
+        # filas: lista de (username, password_hash, salt). Devuelve los
+        # usuarios que quedaron con esas credenciales. Es idempotente: si se
+        # repite después de una interrupción, los usuarios que ya tienen ese
+        # hash se cuentan como aplicados, y solo los que cambian se registran
+        # en la auditoría. La lectura de los usuarios actuales va dentro de la
+        # transacción (BEGIN IMMEDIATE) para que un alta concurrente no haga
+        # fallar el INSERT.
+        conn = self._connect()
+        try:
+            conn.isolation_level = None
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                actuales = dict(conn.execute('SELECT username, password_hash FROM users').fetchall())
+                if modo == 'alta':
+                    nuevos = [f for f in filas if f[0] not in actuales]
+                    conn.executemany(
+                        'INSERT INTO users (username, password_hash, salt, created_at) VALUES (?, ?, ?, datetime("now"))',
+                        nuevos
+                    )
+                    for username, _, _ in nuevos:
+                        self._invalidar(conn, canal_usuario(username))
+                    aplicados = [u for u, h, _ in filas if u not in actuales or actuales[u] == h]
+                    cambiados = nuevos
+                else:
+                    cambiados = [f for f in filas if f[0] in actuales and actuales[f[0]] != f[1]]
+                    conn.executemany(
+                        'UPDATE users SET password_hash = ?, salt = ? WHERE username = ?',
+                        [(h, s, u) for u, h, s in cambiados]
+                    )
+                    # Cerrar las sesiones abiertas con la contraseña anterior
+                    conn.executemany('DELETE FROM sesiones WHERE username = ?', [(u,) for u, _, _ in cambiados])
+                    aplicados = [u for u, _, _ in filas if u in actuales]
+                accion = 'alta_masiva' if modo == 'alta' else 'reset_masivo'
+                auditoria.insertar(conn, [
+                    auditoria.evento('admin', 'admin', accion, u, despues={'trabajo': trabajo_id})
+                    for u, _, _ in cambiados
+                ])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            return aplicados
+        finally:
+            conn.close()
+
+    # Auditoría
+    def registrar_auditoria(self, eventos):
+        conn = self._connect()
+        try:
+            with conn:
+                auditoria.insertar(conn, eventos)
+        finally:
+            conn.close()
+
+    def consultar_auditoria(self, entidad=None, accion=None, desde=None, hasta=None,
+                            cursor=None, limite=None):
+        return auditoria.consultar(
+            self.db_path, entidad, accion, _fecha(desde), _fecha(hasta), cursor,
+            limite or auditoria.TAM_PAGINA
+        )
+
+    # Cubo de estadísticas
+    def mover_entidad(self, username, cambios, subido=None):
+        estadisticas._actualizar_entidad(self.db_path, username, cambios, subido)
+
+    def consultar_cubo(self):
+        return estadisticas._leer_cubo(self.db_path).to_dict('records')
+
+    def marcar_cubo_desactualizado(self):
+        estadisticas._marcar_desactualizado(self.db_path)
+
+    # Limitador de intentos de login
+    def permitir_intento(self, claves):
+        return self._limitador.permitir(**claves)
+
+    def registrar_costo_hash(self, segundos):
+        self._limitador.registrar_costo(segundos)
+
+    def contadores_limitador(self):
+        return limitador.contadores_guardados(self.db_path)
+
+    # Sesiones
+    def crear_sesion(self, username, duracion=DURACION_SESION):
+        token = secrets.token_urlsafe(32)
+        ahora = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM sesiones WHERE expires_at < ?', (ahora,))
+                conn.execute(
+                    'INSERT INTO sesiones VALUES (?, ?, ?)',
+                    (_hash_token(token), username, ahora + duracion)
+                )
+            return token
+        finally:
+            conn.close()
+
+    def obtener_sesion(self, token):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT username FROM sesiones WHERE token_hash = ? AND expires_at >= ?',
+                (_hash_token(token), time.time())
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def eliminar_sesion(self, token):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM sesiones WHERE token_hash = ?', (_hash_token(token),))
+        finally:
+            conn.close()
+
+    # Invalidación de caché
+    def invalidar(self, canal):
+        conn = self._connect()
+        try:
+            with conn:
+                self._invalidar(conn, canal)
+            return self.version(canal)
+        finally:
+            conn.close()
+
+    def version(self, canal):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT version FROM invalidaciones WHERE canal = ?', (canal,)).fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+class EstadoHTTP:
+    def __init__(self, url, token=None, timeout=5):
+        self.url = url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def _llamar(self, metodo, *args):
+        data = json.dumps({'args': args}).encode('utf-8')
+        req = urlrequest.Request(f"{self.url}/{metodo}", data=data, method='POST')
+        req.add_header('Content-Type', 'application/json')
+        if self.token:
+            req.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urlrequest.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read())['resultado']
+        except urlerror.HTTPError as e:
+            raise RuntimeError(f"Error del servidor de estado en {metodo}: {e.code}")
+        except urlerror.URLError as e:
+            raise ConnectionError(f"Servidor de estado no disponible: {e.reason}")
+
+    def obtener_credenciales(self, username):
+        return self._llamar('obtener_credenciales', username)
+
+    def crear_usuario(self, username, password_hash, salt):
+        return self._llamar('crear_usuario', username, password_hash, salt)
+
+    def actualizar_password(self, username, password_hash, salt):
+        return self._llamar('actualizar_password', username, password_hash, salt)
+
+    def eliminar_usuario(self, username):
+        return self._llamar('eliminar_usuario', username)
+
+    def registrar_login(self, username):
+        return self._llamar('registrar_login', username)
+
+    def obtener_perfil(self, username):
+        return self._llamar('obtener_perfil', username)
+
+    def actualizar_perfil(self, username, info):
+        return self._llamar('actualizar_perfil', username, info)
+
+    def listar_usuarios(self):
+        return self._llamar('listar_usuarios')
+
+    def obtener_usuario(self, username):
+        return self._llamar('obtener_usuario', username)
+
+    def aplicar_credenciales(self, modo, filas, trabajo_id=None):
+        return self._llamar('aplicar_credenciales', modo, filas, trabajo_id)
+
+    def registrar_auditoria(self, eventos):
+        return self._llamar('registrar_auditoria', eventos)
+
+    def consultar_auditoria(self, entidad=None, accion=None, desde=None, hasta=None,
+                            cursor=None, limite=None):
+        eventos, siguiente = self._llamar(
+            'consultar_auditoria', entidad, accion,
+            desde.isoformat() if desde else None, hasta.isoformat() if hasta else None,
+            cursor, limite
+        )
+        return eventos, tuple(siguiente) if siguiente else None
+
+    def mover_entidad(self, username, cambios, subido=None):
+        return self._llamar('mover_entidad', username, cambios, subido)
+
+    def consultar_cubo(self):
+        return self._llamar('consultar_cubo')
+
+    def marcar_cubo_desactualizado(self):
+        return self._llamar('marcar_cubo_desactualizado')
+
+    def permitir_intento(self, claves):
+        return self._llamar('permitir_intento', claves)
+
+    def registrar_costo_hash(self, segundos):
+        return self._llamar('registrar_costo_hash', segundos)
+
+    def contadores_limitador(self):
+        return self._llamar('contadores_limitador')
+
+    def crear_sesion(self, username, duracion=DURACION_SESION):
+        return self._llamar('crear_sesion', username, duracion)
+
+    def obtener_sesion(self, token):
+        return self._llamar('obtener_sesion', token)
+
+    def eliminar_sesion(self, token):
+        return self._llamar('eliminar_sesion', token)
+
+    def invalidar(self, canal):
+        return self._llamar('invalidar', canal)
+
+    def version(self, canal):
+        return self._llamar('version', canal)
+
+# Caché local que se descarta cuando otra réplica invalida el canal.
+#
+# Consultar la versión es un viaje al backend igual que leer el valor, así
+# que solo se consulta si pasaron más de ttl segundos desde la última
+# verificación del canal. Streamlit vuelve a ejecutar el script en cada
+# interacción, y esas lecturas seguidas salen de la caché sin ir al backend.
+# A cambio, un cambio hecho en otra réplica puede tardar hasta ttl segundos
+# en verse; los cambios de esta réplica se ven enseguida porque quien
+# escribe llama a descartar().
+TTL_CACHE = 2.0
+
+class CacheVersionada:
+    def __init__(self, backend, ttl=TTL_CACHE, max_items=1000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, canal, cargar):
+        ahora = time.monotonic()
+        with self._lock:
+            item = self._items.get(canal)
+            if item is not None and ahora - item[2] < self.ttl:
+                self._items.move_to_end(canal)
+                return item[1]
+
+        version = self.backend.version(canal)
+        if item is not None and item[0] == version:
+            valor = item[1]
+        else:
+            valor = cargar()
+        with self._lock:
+            self._items[canal] = (version, valor, ahora)
+            self._items.move_to_end(canal)
+            if len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return valor
+
+    def descartar(self, canal):
+        with self._lock:
+            self._items.pop(canal, None)
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def obtener_backend(db_path=None, rol='app'):
+    url = os.environ.get('ESTADO_BACKEND', '')
+    if url.startswith(('http://', 'https://')):
+        clave = (url, rol)
+    else:
+        clave = os.environ.get('ESTADO_DB') or db_path or 'users.db'
+    with _backends_lock:
+        if clave not in _backends:
+            if isinstance(clave, tuple):
+                _backends[clave] = EstadoHTTP(url, os.environ.get(TOKENS_ROL[rol]))
+            else:
+                _backends[clave] = EstadoSQLite(clave)
+        return _backends[clave]
@@ -0,0 +1,224 @@
+import sqlite3
+import threading
+import time
+import os
+from collections import OrderedDict, deque
+import estado
+
+# Limitador de intentos de login con ventana deslizante.
+#
+# Cada intento de login ejecuta 100.000 iteraciones de PBKDF2, así que el
+# límite se controla antes de hashear. Se limita por entidad y por cliente;
+# un intento se rechaza si cualquiera de las dos claves superó su límite en
+# la ventana, y en ese caso no se registra.
+#
+# Por defecto el estado vive en memoria (acotado a MAX_CLAVES con desalojo
+# LRU). Si se define la variable de entorno LIMITADOR_DB, se guarda en esa
+# base SQLite y se comparte entre procesos. Con un backend de estado
+# compartido (ESTADO_BACKEND o ESTADO_DB, ver estado.py) el límite lo
+# controla el backend, así no se multiplica por la cantidad de réplicas.
+#
+# X-Forwarded-For lo controla el cliente, así que solo se usa si
+# PROXIES_CONFIABLES indica cuántos proxies propios hay delante de la app.
+# Si no se conoce la IP del cliente se limita solo por entidad.
+
+VENTANA = 60
+LIMITES = {'entidad': 5, 'cliente': 20}
+MAX_CLAVES = 10000
+PROXIES_CONFIABLES = int(os.environ.get('PROXIES_CONFIABLES', '0'))
+
+def ip_cliente(reenviado, ip_directa, proxies=PROXIES_CONFIABLES):
+    # Cada proxy agrega al final la dirección de quien le habló; la del
+    # cliente es la que agregó el primero de los nuestros, proxies lugares
+    # desde la derecha. Lo que esté más a la izquierda puede ser falso.
+    if proxies and reenviado:
+        saltos = [s.strip() for s in reenviado.split(',') if s.strip()]
+        if len(saltos) >= proxies:
+            return saltos[-proxies]
+    return ip_directa
+
+class LimitadorMemoria:
+    def __init__(self, limites=LIMITES, ventana=VENTANA, max_claves=MAX_CLAVES):
+        self.limites = limites
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self._intentos = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'permitidos': 0, 'rechazados': 0, 'costo_hash': 0.0}
+        self._contadores.update({f'rechazados_{tipo}': 0 for tipo in limites})
+
+    def _ventana(self, clave, ahora):
+        intentos = self._intentos.get(clave)
+        if intentos is None:
+            return None
+        while intentos and intentos[0] <= ahora - self.ventana:
+            intentos.popleft()
+        self._intentos.move_to_end(clave)
+        return intentos
+
+    def permitir(self, **claves):
+        ahora = time.monotonic()
+        with self._lock:
+            for tipo, valor in claves.items():
+                intentos = self._ventana((tipo, valor), ahora)
+                if intentos is not None and len(intentos) >= self.limites[tipo]:
+                    self._contadores['rechazados'] += 1
+                    self._contadores[f'rechazados_{tipo}'] += 1
+                    return False
+
+            for tipo, valor in claves.items():
+                clave = (tipo, valor)
+                if clave not in self._intentos:
+                    self._intentos[clave] = deque()
+                    if len(self._intentos) > self.max_claves:
+                        self._intentos.popitem(last=False)
+                self._intentos[clave].append(ahora)
+            self._contadores['permitidos'] += 1
+            return True
+
+    def registrar_costo(self, segundos):
+        # Promedio móvil del costo de un hash, para estimar el CPU ahorrado
+        with self._lock:
+            previo = self._contadores['costo_hash']
+            self._contadores['costo_hash'] = segundos if not previo else previo * 0.9 + segundos * 0.1
+
+    def contadores(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+        contadores['cpu_ahorrado'] = contadores['rechazados'] * contadores['costo_hash']
+        return contadores
+
+class LimitadorSQLite:
+    def __init__(self, db_path, limites=LIMITES, ventana=VENTANA):
+        self.db_path = db_path
+        self.limites = limites
+        self.ventana = ventana
+        conn = sqlite3.connect(db_path)
+        try:
+            init_tablas(conn)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def _sumar(self, conn, nombre, valor=1):
+        conn.execute('''
+            INSERT INTO limitador_contadores VALUES (?, ?)
+            ON CONFLICT (nombre) DO UPDATE SET valor = valor + excluded.valor
+        ''', (nombre, valor))
+
+    def permitir(self, **claves):
+        ahora = time.time()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE serializa el control y el registro entre procesos
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM limitador_intentos WHERE ts <= ?', (ahora - self.ventana,))
+            for tipo, valor in claves.items():
+                cantidad = conn.execute(
+                    'SELECT COUNT(*) FROM limitador_intentos WHERE clave = ?',
+                    (f'{tipo}:{valor}',)
+                ).fetchone()[0]
+                if cantidad >= self.limites[tipo]:
+                    self._sumar(conn, 'rechazados')
+                    self._sumar(conn, f'rechazados_{tipo}')
+                    conn.execute('COMMIT')
+                    return False
+
+            conn.executemany(
+                'INSERT INTO limitador_intentos VALUES (?, ?)',
+                [(f'{tipo}:{valor}', ahora) for tipo, valor in claves.items()]
+            )
+            self._sumar(conn, 'permitidos')
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def registrar_costo(self, segundos):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO limitador_contadores VALUES ('costo_hash', ?)
+                ON CONFLICT (nombre) DO UPDATE SET valor = valor * 0.9 + excluded.valor * 0.1
+            ''', (segundos,))
+        finally:
+            conn.close()
+
+    def contadores(self):
+        return contadores_guardados(self.db_path)
+
+class LimitadorEstado:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def permitir(self, **claves):
+        return self.backend.permitir_intento(claves)
+
+    def registrar_costo(self, segundos):
+        self.backend.registrar_costo_hash(segundos)
+
+    def contadores(self):
+        return self.backend.contadores_limitador()
+
+def init_tablas(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS limitador_intentos (
+            clave TEXT NOT NULL,
+            ts REAL NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_limitador_clave ON limitador_intentos (clave, ts)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_limitador_ts ON limitador_intentos (ts)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS limitador_contadores (
+            nombre TEXT PRIMARY KEY,
+            valor REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def contadores_guardados(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='limitador_contadores'")
+        if c.fetchone() is None:
+            return None
+        contadores = {'permitidos': 0, 'rechazados': 0, 'costo_hash': 0.0}
+        contadores.update(dict(c.execute('SELECT nombre, valor FROM limitador_contadores').fetchall()))
+    finally:
+        conn.close()
+    contadores['cpu_ahorrado'] = contadores['rechazados'] * contadores['costo_hash']
+    return contadores
+
+_limitador = None
+_limitador_lock = threading.Lock()
+
+def obtener_limitador():
+    global _limitador
+    with _limitador_lock:
+        if _limitador is None:
+            db_path = os.environ.get('LIMITADOR_DB')
+            if db_path:
+                _limitador = LimitadorSQLite(db_path)
+            elif estado.backend_compartido():
+                _limitador = LimitadorEstado(estado.obtener_backend())
+            else:
+                _limitador = LimitadorMemoria()
+        return _limitador
+
+def permitir_login(entidad, cliente=None):
+    claves = {'entidad': entidad.strip().lower()}
+    if cliente:
+        claves['cliente'] = cliente
+    return obtener_limitador().permitir(**claves)
+
+def registrar_costo(segundos):
+    obtener_limitador().registrar_costo(segundos)
@@ -0,0 +1,173 @@
+import sqlite3
+import argparse
+import datetime
+import time
+import os
+from email.message import EmailMessage
+import pandas as pd
+import estado
+from entidades import obtener_snapshot
+
+# Recordatorios de vencimiento de nómina y mandato del presidente.
+#
+# Cada corrida recorre el padrón completo en una sola pasada con pandas, lo
+# cruza con los emails de los usuarios (una sola consulta al backend de
+# estado) y encola los avisos en recordatorios_outbox. La columna clave evita
+# encolar dos veces el mismo aviso (entidad, documento, fecha de vencimiento
+# y etapa). El envío escribe cada aviso como archivo .eml en OUTBOX_DIR en
+# lugar de usar SMTP.
+
+DIAS_AVISO = 30
+TAM_LOTE = 500
+OUTBOX_DIR = 'outbox'
+REMITENTE = 'autogestion@came.org.ar'
+
+VENCIMIENTOS = {
+    'vencimiento_nomina': 'la nómina de autoridades',
+    'vencimiento_presidente': 'el mandato del presidente'
+}
+
+def init_tablas(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS recordatorios_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            clave TEXT NOT NULL UNIQUE,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            vencimiento DATE NOT NULL,
+            etapa TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            cuerpo TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            enviado_at TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_recordatorios_pendientes ON recordatorios_outbox (enviado_at)')
+    conn.commit()
+
+def calcular_recordatorios(df, emails, hoy=None, dias_aviso=DIAS_AVISO):
+    hoy = pd.Timestamp(hoy or datetime.date.today())
+    columnas = [col for col in VENCIMIENTOS if col in df.columns]
+    if not columnas or 'nombre_entidad' not in df.columns:
+        return pd.DataFrame()
+
+    # Una fila por entidad y vencimiento
+    largo = df[['nombre_entidad'] + columnas].melt(
+        id_vars='nombre_entidad', var_name='tipo', value_name='vencimiento'
+    ).dropna()
+    dias = (largo['vencimiento'] - hoy).dt.days
+    largo = largo[dias <= dias_aviso].copy()
+    largo['etapa'] = (largo['vencimiento'] < hoy).map({True: 'vencido', False: 'proximo'})
+
+    largo = largo.merge(emails, left_on='nombre_entidad', right_on='username')
+    if largo.empty:
+        return largo
+
+    fecha = largo['vencimiento'].dt.strftime('%d/%m/%Y')
+    documento = largo['tipo'].map(VENCIMIENTOS)
+    vencido = largo['etapa'] == 'vencido'
+    largo['clave'] = (largo['username'] + '|' + largo['tipo'] + '|'
+                      + largo['vencimiento'].dt.strftime('%Y-%m-%d') + '|' + largo['etapa'])
+    largo['asunto'] = ("CAME - " + vencido.map({True: "Vencimiento de ", False: "Próximo vencimiento de "})
+                       + documento)
+    largo['cuerpo'] = ("Estimados/as de " + largo['username'] + ":\n\n"
+                       + "Les recordamos que " + documento
+                       + vencido.map({True: " venció el ", False: " vence el "}) + fecha + ".\n"
+                       + "Pueden enviar la documentación actualizada desde el portal de Autogestión CAME.\n")
+    largo['vencimiento'] = largo['vencimiento'].dt.strftime('%Y-%m-%d')
+    return largo[['clave', 'username', 'email', 'tipo', 'vencimiento', 'etapa', 'asunto', 'cuerpo']]
+
+def encolar_recordatorios(db_path='users.db', hoy=None, dias_aviso=DIAS_AVISO, tam_lote=TAM_LOTE):
+    conn = sqlite3.connect(db_path)
+    try:
+        init_tablas(conn)
+        usuarios = pd.DataFrame(
+            estado.obtener_backend(db_path, rol='admin').listar_usuarios(),
+            columns=estado.CAMPOS_USUARIO
+        )
+        emails = usuarios[['username', 'email']].dropna(subset=['email'])
+        emails = emails.assign(email=emails['email'].str.strip())
+        emails = emails[emails['email'] != ''].reset_index(drop=True)
+        recordatorios = calcular_recordatorios(obtener_snapshot().df, emails, hoy, dias_aviso)
+
+        encolados = 0
+        filas = list(recordatorios.itertuples(index=False, name=None))
+        for i in range(0, len(filas), tam_lote):
+            with conn:
+                c = conn.cursor()
+                c.executemany('''
+                    INSERT OR IGNORE INTO recordatorios_outbox
+                        (clave, username, email, tipo, vencimiento, etapa, asunto, cuerpo)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', filas[i:i + tam_lote])
+                encolados += c.rowcount
+        return {'candidatos': len(filas), 'encolados': encolados}
+    finally:
+        conn.close()
+
+def enviar_pendientes(db_path='users.db', outbox_dir=OUTBOX_DIR, tam_lote=TAM_LOTE):
+    os.makedirs(outbox_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    enviados = 0
+    try:
+        init_tablas(conn)
+        while True:
+            lote = conn.execute('''
+                SELECT id, email, asunto, cuerpo FROM recordatorios_outbox
+                WHERE enviado_at IS NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (tam_lote,)).fetchall()
+            if not lote:
+                break
+
+            for id_, email, asunto, cuerpo in lote:
+                msg = EmailMessage()
+                msg['From'] = REMITENTE
+                msg['To'] = email
+                msg['Subject'] = asunto
+                msg.set_content(cuerpo)
+                with open(os.path.join(outbox_dir, f"recordatorio_{id_}.eml"), 'wb') as f:
+                    f.write(bytes(msg))
+
+            with conn:
+                conn.executemany(
+                    'UPDATE recordatorios_outbox SET enviado_at = CURRENT_TIMESTAMP WHERE id = ?',
+                    [(row[0],) for row in lote]
+                )
+            enviados += len(lote)
+        return enviados
+    finally:
+        conn.close()
+
+def ejecutar(db_path='users.db', outbox_dir=OUTBOX_DIR):
+    inicio = time.perf_counter()
+    resumen = encolar_recordatorios(db_path)
+    resumen['enviados'] = enviar_pendientes(db_path, outbox_dir)
+    resumen['segundos'] = time.perf_counter() - inicio
+    return resumen
+
+def main():
+    parser = argparse.ArgumentParser(description="Recordatorios de vencimientos")
+    parser.add_argument('--db', default='users.db')
+    parser.add_argument('--outbox', default=OUTBOX_DIR)
+    parser.add_argument('--intervalo', type=int, default=0,
+                        help="Segundos entre corridas; 0 para ejecutar una sola vez")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            resumen = ejecutar(args.db, args.outbox)
+            print(f"{datetime.datetime.now()}: {resumen['candidatos']} avisos calculados, "
+                  f"{resumen['encolados']} encolados, {resumen['enviados']} enviados "
+                  f"en {resumen['segundos']:.2f}s")
+        except Exception as e:
+            print(f"Error generando recordatorios: {str(e)}")
+        if not args.intervalo:
+            break
+        time.sleep(args.intervalo)
+
+if __name__ == '__main__':
+    main()
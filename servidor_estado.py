@@ -0,0 +1,104 @@
+import json
+import argparse
+import os
+import secrets
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from estado import EstadoSQLite, METODOS, PERMISOS, TOKENS_ROL
+
+# Servidor de estado compartido para correr varias réplicas de la app.
+# Expone las operaciones de EstadoSQLite como POST /<metodo> con cuerpo
+# {"args": [...]} y responde {"resultado": ...}. Todas las réplicas apuntan
+# a este servidor con ESTADO_BACKEND=http://host:puerto, así solo este
+# proceso escribe la base y no hay contención de bloqueos entre réplicas.
+#
+# Cada llamada se autentica con el token de un rol (ESTADO_TOKEN para la
+# app, ESTADO_TOKEN_ADMIN para el panel) y solo puede usar las operaciones
+# de ese rol en PERMISOS. Sin tokens el servidor solo acepta escuchar en
+# loopback, donde las llamadas se tratan como del rol admin.
+
+LOOPBACK = ('127.0.0.1', 'localhost', '::1')
+
+class EstadoHandler(BaseHTTPRequestHandler):
+    server_version = "EstadoCAME"
+    backend = None
+    tokens = {}
+
+    def _responder(self, status, cuerpo):
+        data = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rol(self):
+        if not self.tokens:
+            return 'admin'
+        enviado = self.headers.get('Authorization', '')
+        for token, rol in self.tokens.items():
+            if secrets.compare_digest(enviado, f'Bearer {token}'):
+                return rol
+        return None
+
+    def do_POST(self):
+        rol = self._rol()
+        if rol is None:
+            return self._responder(401, {'error': "No autorizado"})
+
+        metodo = self.path.strip('/')
+        if metodo not in METODOS:
+            return self._responder(404, {'error': "Operación desconocida"})
+        if metodo not in PERMISOS[rol]:
+            return self._responder(403, {'error': "Operación no permitida"})
+
+        try:
+            largo = int(self.headers.get('Content-Length', 0))
+            args = json.loads(self.rfile.read(largo) or b'{}').get('args', [])
+        except Exception:
+            return self._responder(400, {'error': "Cuerpo JSON inválido"})
+
+        try:
+            resultado = getattr(self.backend, metodo)(*args)
+        except Exception as e:
+            print(f"[servidor_estado] Error en {metodo}: {str(e)}")
+            return self._responder(500, {'error': str(e)})
+        self._responder(200, {'resultado': resultado})
+
+    def log_message(self, format, *args):
+        pass
+
+def crear_servidor(db_path='users.db', host='127.0.0.1', port=8503, tokens=None):
+    # tokens: {rol: token}
+    tokens = {token: rol for rol, token in (tokens or {}).items() if token}
+    if not tokens and host not in LOOPBACK:
+        raise ValueError(
+            f"Sin {' ni '.join(TOKENS_ROL.values())} el servidor solo puede escuchar en 127.0.0.1"
+        )
+    handler = type('Handler', (EstadoHandler,), {
+        'backend': EstadoSQLite(db_path),
+        'tokens': tokens
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de estado compartido")
+    parser.add_argument('--db', default='users.db')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8503)
+    args = parser.parse_args()
+
+    tokens = {rol: os.environ.get(variable) for rol, variable in TOKENS_ROL.items()}
+    try:
+        server = crear_servidor(args.db, args.host, args.port, tokens)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Servidor de estado escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import api_estado
+
+
+def test_coincide_etag():
+    etag = '"abc-2024-01-01-1234"'
+    assert api_estado.coincide_etag(etag, etag)
+    assert api_estado.coincide_etag('*', etag)
+    assert api_estado.coincide_etag(f'"otro", W/{etag}', etag)
+    assert api_estado.coincide_etag(f'"otro",{etag}', etag)
+    assert not api_estado.coincide_etag('"otro"', etag)
+    assert not api_estado.coincide_etag(None, etag)
@@ -0,0 +1,97 @@
+import sqlite3
+import datetime
+import pytest
+import auditoria
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'users.db')
+    conn = sqlite3.connect(db_path)
+    try:
+        auditoria.init_tablas(conn)
+    finally:
+        conn.close()
+    return db_path
+
+
+def cargar(db_path, filas):
+    # filas: (ts, accion, entidad)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            auditoria.insertar(conn, [
+                (ts, 'admin', 'admin', accion, entidad, None, None)
+                for ts, accion, entidad in filas
+            ])
+    finally:
+        conn.close()
+
+
+def paginar(db_path, limite, **filtros):
+    paginas = []
+    cursor = None
+    while True:
+        eventos, cursor = auditoria.consultar(db_path, cursor=cursor, limite=limite, **filtros)
+        paginas.append([e['id'] for e in eventos])
+        if cursor is None:
+            return paginas
+
+
+def test_paginado_con_ts_repetidos(db_path):
+    # Las páginas cortan en medio de grupos con el mismo ts
+    filas = [('2024-05-01 10:00:00', 'login', f'E{i}') for i in range(7)]
+    filas += [('2024-05-01 11:00:00', 'alta', f'E{i}') for i in range(5)]
+    cargar(db_path, filas)
+
+    paginas = paginar(db_path, limite=3)
+    ids = [i for pagina in paginas for i in pagina]
+    assert [len(p) for p in paginas] == [3, 3, 3, 3]
+    assert len(ids) == len(set(ids)) == 12
+    # Primero el ts más reciente; dentro del mismo ts, id descendente
+    assert ids == list(range(12, 7, -1)) + list(range(7, 0, -1))
+
+
+def test_paginado_exacto_no_deja_pagina_vacia(db_path):
+    cargar(db_path, [('2024-05-01 10:00:00', 'login', 'E') for _ in range(4)])
+    assert paginar(db_path, limite=2) == [[4, 3], [2, 1]]
+
+
+def test_filtros(db_path):
+    cargar(db_path, [
+        ('2024-05-01 10:00:00', 'login', 'A'),
+        ('2024-05-02 10:00:00', 'login', 'B'),
+        ('2024-05-02 12:00:00', 'alta', 'A'),
+        ('2024-05-03 09:00:00', 'login', 'A'),
+    ])
+    eventos, _ = auditoria.consultar(db_path, entidad='A', accion='login')
+    assert [e['id'] for e in eventos] == [4, 1]
+
+    eventos, _ = auditoria.consultar(db_path, desde=datetime.date(2024, 5, 2),
+                                     hasta=datetime.date(2024, 5, 2))
+    assert [e['id'] for e in eventos] == [3, 2]
+
+    assert paginar(db_path, limite=1, entidad='A') == [[4], [3], [1]]
+
+
+@pytest.mark.parametrize('sentencia', [
+    "UPDATE auditoria SET actor = 'otro'",
+    "DELETE FROM auditoria",
+])
+def test_solo_insercion(db_path, sentencia):
+    cargar(db_path, [('2024-05-01 10:00:00', 'login', 'A')])
+    conn = sqlite3.connect(db_path)
+    try:
+        with pytest.raises(sqlite3.IntegrityError, match='solo inserción'):
+            with conn:
+                conn.execute(sentencia)
+        assert conn.execute('SELECT actor FROM auditoria').fetchall() == [('admin',)]
+    finally:
+        conn.close()
+
+
+def test_registrar_usa_buffer(db_path):
+    auditoria.registrar('autogestion', 'A', 'login', 'A', db_path=db_path)
+    auditoria.flush()
+    eventos, _ = auditoria.consultar(db_path)
+    assert [(e['origen'], e['accion'], e['entidad']) for e in eventos] == [('autogestion', 'login', 'A')]
@@ -0,0 +1,93 @@
+import sqlite3
+import pytest
+import carga_masiva
+import estado
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.delenv('ESTADO_BACKEND', raising=False)
+    monkeypatch.delenv('ESTADO_DB', raising=False)
+    monkeypatch.setattr(estado, '_backends', {})
+    return str(tmp_path / 'users.db')
+
+
+def test_credenciales_por_entregar_sobreviven_a_la_sesion(db_path):
+    trabajo_id = carga_masiva.crear_trabajo(db_path, 'alta', [('A', None), ('B', 'fija')])
+    carga_masiva.ejecutar_trabajo(db_path, trabajo_id, workers=1)
+
+    pendientes = carga_masiva.trabajos_por_entregar(db_path)
+    assert [(t['id'], t['modo'], t['credenciales']) for t in pendientes] == [(trabajo_id, 'alta', 1)]
+    assert [u for u, _ in carga_masiva.credenciales_generadas(db_path, trabajo_id)] == ['A']
+
+    carga_masiva.descartar_credenciales(db_path, trabajo_id)
+    assert carga_masiva.trabajos_por_entregar(db_path) == []
+
+
+def test_al_aplicar_se_borran_los_hashes(db_path):
+    trabajo_id = carga_masiva.crear_trabajo(db_path, 'alta', [('A', None), ('B', 'fija')])
+    carga_masiva.ejecutar_trabajo(db_path, trabajo_id, workers=1)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute(
+            'SELECT COUNT(*) FROM carga_masiva_items WHERE password_hash IS NOT NULL OR salt IS NOT NULL'
+        ).fetchone()[0] == 0
+    finally:
+        conn.close()
+    assert estado.obtener_backend(db_path).obtener_credenciales('B') is not None
+
+
+class Interrupcion(Exception):
+    pass
+
+
+def test_reanudar_despues_de_un_lote(db_path):
+    nombres = ['A', 'B', 'C', 'D', 'E']
+    trabajo_id = carga_masiva.crear_trabajo(db_path, 'alta', [(n, None) for n in nombres])
+
+    def cortar(procesados, total, por_segundo):
+        raise Interrupcion()
+
+    with pytest.raises(Interrupcion):
+        carga_masiva.ejecutar_trabajo(db_path, trabajo_id, cortar, workers=1, tam_lote=2)
+    assert [(t['id'], t['hasheados']) for t in carga_masiva.trabajos_pendientes(db_path)] == [(trabajo_id, 2)]
+    assert estado.obtener_backend(db_path).listar_usuarios() == []
+
+    resumen = carga_masiva.ejecutar_trabajo(db_path, trabajo_id, workers=1, tam_lote=2)
+    assert (resumen['hasheados'], resumen['aplicados']) == (3, 5)
+    assert carga_masiva.trabajos_pendientes(db_path) == []
+    assert [u for u, _ in carga_masiva.credenciales_generadas(db_path, trabajo_id)] == nombres
+
+
+def test_reanudar_despues_de_aplicar(db_path, monkeypatch):
+    nombres = ['A', 'B', 'C']
+    trabajo_id = carga_masiva.crear_trabajo(db_path, 'alta', [(n, None) for n in nombres])
+    backend = estado.obtener_backend(db_path, rol='admin')
+    aplicar = backend.aplicar_credenciales
+
+    # Se corta entre la escritura en el backend y la marca de los items
+    def aplicar_y_cortar(*args):
+        aplicar(*args)
+        raise Interrupcion()
+
+    monkeypatch.setattr(backend, 'aplicar_credenciales', aplicar_y_cortar)
+    with pytest.raises(Interrupcion):
+        carga_masiva.ejecutar_trabajo(db_path, trabajo_id, workers=1)
+    monkeypatch.undo()
+    monkeypatch.setattr(estado, '_backends', {db_path: backend})
+
+    resumen = carga_masiva.ejecutar_trabajo(db_path, trabajo_id, workers=1)
+    assert resumen['aplicados'] == 3
+    assert [u for u, _ in carga_masiva.credenciales_generadas(db_path, trabajo_id)] == nombres
+    eventos, _ = backend.consultar_auditoria(accion='alta_masiva')
+    assert sorted(e['entidad'] for e in eventos) == nombres
+
+
+def test_reseteo_ignora_usuarios_inexistentes(db_path):
+    estado.obtener_backend(db_path).crear_usuario('A', 'hash', 'salt')
+    trabajo_id = carga_masiva.crear_trabajo(db_path, 'reseteo', [('A', None), ('X', None)])
+    resumen = carga_masiva.ejecutar_trabajo(db_path, trabajo_id, workers=1)
+    assert resumen['aplicados'] == 1
+    assert [u for u, _ in carga_masiva.credenciales_generadas(db_path, trabajo_id)] == ['A']
+    assert estado.obtener_backend(db_path).obtener_credenciales('A')[0] != 'hash'
@@ -0,0 +1,117 @@
+import io
+import contextlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pytest
+import estado
+import estadisticas
+
+
+class Snapshot:
+    version = 'v1'
+    df = pd.DataFrame({
+        'nombre_entidad': ['A', 'B', 'C', 'D', 'E'],
+        'provincia': ['Salta', 'Salta', 'Jujuy', 'Jujuy', None],
+        'localidad': ['Centro', 'Centro', 'Norte', 'Sur', None],
+        'nomina': ['Vigente', 'Vencida', 'Vigente', 'Vigente', 'Vigente'],
+        'estatuto': ['No', 'Si', 'Si', 'Si', 'Si'],
+        'igj': ['Si', 'Si', 'Si', 'Si', 'Si'],
+        'afip': ['Si', 'Si', 'Si', 'Si', 'Si'],
+    })
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ESTADO_BACKEND', raising=False)
+    monkeypatch.delenv('ESTADO_DB', raising=False)
+    monkeypatch.setattr(estado, '_backends', {})
+    monkeypatch.setattr(estadisticas, 'obtener_snapshot', lambda: Snapshot)
+    db_path = str(tmp_path / 'users.db')
+    backend = estado.EstadoSQLite(db_path)
+    for username in ['A', 'B']:
+        backend.crear_usuario(username, 'hash', 'salt')
+    return db_path
+
+
+def leer(db_path, tabla):
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql(f'SELECT * FROM {tabla}', conn)
+    finally:
+        conn.close()
+
+
+def verificar_consistencia(db_path):
+    # El cubo coincide con las celdas de cada entidad
+    cubo = leer(db_path, 'estadisticas_cubo')
+    entidades = leer(db_path, 'estadisticas_entidades')
+    esperado = entidades.groupby(estadisticas.DIMENSIONES).size().reset_index(name='cantidad')
+    pd.testing.assert_frame_equal(
+        cubo.sort_values(estadisticas.DIMENSIONES).reset_index(drop=True),
+        esperado.sort_values(estadisticas.DIMENSIONES).reset_index(drop=True),
+        check_dtype=False
+    )
+    assert cubo['cantidad'].sum() == len(Snapshot.df)
+    return entidades.set_index('username')
+
+
+def test_reconstruir(db_path):
+    cubo = estadisticas.consultar_cubo(db_path)
+    assert cubo['cantidad'].sum() == 5
+    assert cubo.loc[cubo['registrada'] == 1, 'cantidad'].sum() == 2
+    entidades = verificar_consistencia(db_path)
+    assert entidades.loc['A', 'documentacion'] == "Incompleta"
+    assert entidades.loc['E', 'provincia'] == estadisticas.SIN_DATO
+
+
+def test_login_subida_y_baja_mueven_una_celda(db_path):
+    estadisticas.consultar_cubo(db_path)
+
+    estadisticas.registrar_login('A', db_path)
+    entidades = verificar_consistencia(db_path)
+    assert entidades.loc['A', 'activa'] == 1
+
+    estadisticas.registrar_subida('A', 'estatuto', db_path)
+    entidades = verificar_consistencia(db_path)
+    assert entidades.loc['A', 'documentacion'] == "En revisión"
+
+    estadisticas.registrar_alta('C', db_path)
+    estadisticas.registrar_baja('A', db_path)
+    entidades = verificar_consistencia(db_path)
+    assert (entidades.loc['A', 'registrada'], entidades.loc['A', 'activa']) == (0, 0)
+    assert entidades.loc['C', 'registrada'] == 1
+
+    # Una entidad fuera del padrón no altera el cubo
+    estadisticas.registrar_login('Z', db_path)
+    verificar_consistencia(db_path)
+
+
+def test_reconstruir_conserva_subidas_registradas(db_path):
+    estadisticas.consultar_cubo(db_path)
+    estadisticas.registrar_subida('A', 'estatuto', db_path)
+    estadisticas.reconstruir_cubo(db_path)
+    entidades = verificar_consistencia(db_path)
+    assert entidades.loc['A', 'documentacion'] == "En revisión"
+
+
+def _mover(args):
+    # Devuelve lo que _actualizar_entidad haya informado como error
+    db_path, username, i = args
+    salida = io.StringIO()
+    with contextlib.redirect_stdout(salida):
+        if i % 2:
+            estadisticas._actualizar_entidad(db_path, username, {'registrada': 1, 'activa': 1})
+        else:
+            estadisticas._actualizar_entidad(db_path, username, {'registrada': 0, 'activa': 0})
+    return salida.getvalue()
+
+
+def test_movimientos_concurrentes(db_path):
+    estadisticas.consultar_cubo(db_path)
+    tareas = [(db_path, username, i) for i in range(20) for username in ['A', 'B', 'C', 'D', 'E']]
+    with ProcessPoolExecutor(max_workers=8) as pool:
+        errores = [e for e in pool.map(_mover, tareas) if e]
+    assert errores == []
+    verificar_consistencia(db_path)
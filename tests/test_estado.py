@@ -0,0 +1,147 @@
+import sqlite3
+import pytest
+import estado
+
+
+class Reloj:
+    def __init__(self, ahora=1000.0):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(estado.time, 'monotonic', reloj)
+    return reloj
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = estado.EstadoSQLite(str(tmp_path / 'users.db'))
+    backend.crear_usuario('A', 'hash', 'salt')
+    return backend
+
+
+class Contador:
+    def __init__(self, backend):
+        self.backend = backend
+        self.versiones = 0
+
+    def version(self, canal):
+        self.versiones += 1
+        return self.backend.version(canal)
+
+
+def perfil(backend, cache, cargas):
+    def cargar():
+        cargas.append(1)
+        return backend.obtener_perfil('A')
+    return cache.obtener(estado.canal_usuario('A'), cargar)
+
+
+def test_cache_no_consulta_version_dentro_del_ttl(reloj, backend):
+    contador = Contador(backend)
+    cache = estado.CacheVersionada(contador, ttl=2)
+    cargas = []
+    for _ in range(5):
+        perfil(backend, cache, cargas)
+    assert contador.versiones == 1
+    assert len(cargas) == 1
+
+    # Vencido el ttl se verifica la versión, pero sin cambios no se recarga
+    reloj.ahora += 3
+    perfil(backend, cache, cargas)
+    assert contador.versiones == 2
+    assert len(cargas) == 1
+
+
+def test_cache_ve_cambios_de_otra_replica_al_vencer_el_ttl(reloj, backend):
+    cache = estado.CacheVersionada(backend, ttl=2)
+    cargas = []
+    assert perfil(backend, cache, cargas)['email'] is None
+
+    info = dict(backend.obtener_perfil('A'), email='a@b.c')
+    backend.actualizar_perfil('A', info)
+    assert perfil(backend, cache, cargas)['email'] is None
+
+    reloj.ahora += 3
+    assert perfil(backend, cache, cargas)['email'] == 'a@b.c'
+    assert len(cargas) == 2
+
+
+def test_descartar(reloj, backend):
+    cache = estado.CacheVersionada(backend, ttl=2)
+    cargas = []
+    perfil(backend, cache, cargas)
+    backend.actualizar_perfil('A', dict(backend.obtener_perfil('A'), email='a@b.c'))
+    cache.descartar(estado.canal_usuario('A'))
+    assert perfil(backend, cache, cargas)['email'] == 'a@b.c'
+
+
+def test_aplicar_credenciales_alta_es_idempotente(backend):
+    filas = [('A', 'nuevo', 's1'), ('B', 'hb', 's2'), ('C', 'hc', 's3')]
+    assert backend.aplicar_credenciales('alta', filas) == ['B', 'C']
+    # Repetir tras una interrupción reconoce lo ya aplicado
+    assert backend.aplicar_credenciales('alta', filas) == ['B', 'C']
+    assert backend.obtener_credenciales('A') == ['hash', 'salt']
+    assert sorted(u['username'] for u in backend.listar_usuarios()) == ['A', 'B', 'C']
+    # Solo se auditan las altas efectivas, una vez
+    eventos, _ = backend.consultar_auditoria(accion='alta_masiva')
+    assert sorted(e['entidad'] for e in eventos) == ['B', 'C']
+
+
+def test_aplicar_credenciales_reseteo_cierra_sesiones(backend):
+    token = backend.crear_sesion('A')
+    filas = [('A', 'nuevo', 's1'), ('X', 'hx', 's2')]
+    assert backend.aplicar_credenciales('reseteo', filas) == ['A']
+    assert backend.obtener_credenciales('A') == ['nuevo', 's1']
+    assert backend.obtener_sesion(token) is None
+    assert backend.obtener_credenciales('X') is None
+
+    # Repetir no vuelve a cerrar sesiones nuevas
+    token = backend.crear_sesion('A')
+    assert backend.aplicar_credenciales('reseteo', filas) == ['A']
+    assert backend.obtener_sesion(token) == 'A'
+
+
+def test_obtener_usuario(backend):
+    usuario = backend.obtener_usuario('A')
+    assert set(usuario) == set(estado.CAMPOS_USUARIO)
+    assert usuario['username'] == 'A'
+    assert backend.obtener_usuario('X') is None
+
+
+def test_estado_db_tiene_prioridad(tmp_path, monkeypatch):
+    monkeypatch.delenv('ESTADO_BACKEND', raising=False)
+    monkeypatch.setenv('ESTADO_DB', str(tmp_path / 'compartida.db'))
+    monkeypatch.setattr(estado, '_backends', {})
+    estado.obtener_backend().crear_usuario('A', 'hash', 'salt')
+    admin = estado.obtener_backend(str(tmp_path / 'users.db'), rol='admin')
+    assert [u['username'] for u in admin.listar_usuarios()] == ['A']
+
+
+def test_aplicar_credenciales_bloquea_altas_concurrentes(backend, monkeypatch):
+    db_path = backend.db_path
+    bloqueado = []
+
+    class Conexion(sqlite3.Connection):
+        def execute(self, sql, *args):
+            cursor = super().execute(sql, *args)
+            if sql.startswith('SELECT username, password_hash FROM users'):
+                # Un alta de otro proceso entre la lectura y el INSERT
+                otra = sqlite3.connect(db_path, timeout=0)
+                try:
+                    otra.execute("INSERT INTO users (username, password_hash, salt) VALUES ('B', 'h', 's')")
+                    otra.commit()
+                except sqlite3.OperationalError:
+                    bloqueado.append(True)
+                finally:
+                    otra.close()
+            return cursor
+
+    monkeypatch.setattr(backend, '_connect', lambda: sqlite3.connect(db_path, timeout=10, factory=Conexion))
+    assert backend.aplicar_credenciales('alta', [('B', 'hb', 's2')]) == ['B']
+    assert bloqueado == [True]
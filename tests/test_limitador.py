@@ -0,0 +1,123 @@
+import pytest
+import limitador
+
+
+class Reloj:
+    def __init__(self, ahora=1000.0):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(limitador.time, 'monotonic', reloj)
+    monkeypatch.setattr(limitador.time, 'time', reloj)
+    return reloj
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def crear(request, tmp_path):
+    def crear(limites, ventana=60):
+        if request.param == 'memoria':
+            return limitador.LimitadorMemoria(limites, ventana)
+        return limitador.LimitadorSQLite(str(tmp_path / 'limitador.db'), limites, ventana)
+    return crear
+
+
+def test_rechaza_al_superar_el_limite(reloj, crear):
+    lim = crear({'entidad': 3, 'cliente': 10})
+    resultados = [lim.permitir(entidad='a', cliente='x') for _ in range(5)]
+    assert resultados == [True, True, True, False, False]
+
+    contadores = lim.contadores()
+    assert contadores['permitidos'] == 3
+    assert contadores['rechazados'] == 2
+    assert contadores['rechazados_entidad'] == 2
+
+
+def test_ventana_deslizante(reloj, crear):
+    lim = crear({'entidad': 2, 'cliente': 10}, ventana=60)
+    assert lim.permitir(entidad='a', cliente='x')
+    reloj.ahora += 30
+    assert lim.permitir(entidad='a', cliente='x')
+    reloj.ahora += 29
+    assert not lim.permitir(entidad='a', cliente='x')
+
+    # Sale de la ventana solo el primer intento
+    reloj.ahora += 2
+    assert lim.permitir(entidad='a', cliente='x')
+    assert not lim.permitir(entidad='a', cliente='x')
+
+
+def test_intento_rechazado_no_consume_otras_claves(reloj, crear):
+    lim = crear({'entidad': 1, 'cliente': 2})
+    assert lim.permitir(entidad='a', cliente='x')
+    assert not lim.permitir(entidad='a', cliente='x')
+    assert not lim.permitir(entidad='a', cliente='x')
+
+    # Los rechazos por entidad no cuentan para el cliente
+    assert lim.permitir(entidad='b', cliente='x')
+    assert not lim.permitir(entidad='c', cliente='x')
+    assert lim.contadores()['rechazados_cliente'] == 1
+
+
+def test_sqlite_comparte_estado_entre_instancias(reloj, tmp_path):
+    db_path = str(tmp_path / 'limitador.db')
+    lim1 = limitador.LimitadorSQLite(db_path, {'entidad': 2, 'cliente': 10})
+    lim2 = limitador.LimitadorSQLite(db_path, {'entidad': 2, 'cliente': 10})
+    assert lim1.permitir(entidad='a', cliente='x')
+    assert lim2.permitir(entidad='a', cliente='y')
+    assert not lim1.permitir(entidad='a', cliente='z')
+    assert limitador.contadores_guardados(db_path)['rechazados'] == 1
+
+
+def test_desalojo_lru(reloj):
+    lim = limitador.LimitadorMemoria({'entidad': 1, 'cliente': 100}, max_claves=3)
+    assert lim.permitir(entidad='a', cliente='x')
+    assert lim.permitir(entidad='b', cliente='x')
+    assert len(lim._intentos) == 3
+
+    # Consultar 'a' la vuelve la más reciente; al agregar 'c' se desaloja 'b'
+    assert not lim.permitir(entidad='a', cliente='x')
+    assert lim.permitir(entidad='c', cliente='x')
+    assert len(lim._intentos) == 3
+    assert ('entidad', 'b') not in lim._intentos
+    assert ('entidad', 'a') in lim._intentos
+    assert lim.permitir(entidad='b', cliente='x')
+
+
+def test_cpu_ahorrado(reloj):
+    lim = limitador.LimitadorMemoria({'entidad': 1, 'cliente': 10})
+    lim.registrar_costo(0.1)
+    lim.permitir(entidad='a', cliente='x')
+    lim.permitir(entidad='a', cliente='x')
+    lim.permitir(entidad='a', cliente='x')
+    assert lim.contadores()['cpu_ahorrado'] == pytest.approx(0.2)
+
+
+def test_ip_cliente_sin_proxy_ignora_forwarded():
+    assert limitador.ip_cliente('1.1.1.1', '9.9.9.9', proxies=0) == '9.9.9.9'
+
+
+def test_ip_cliente_toma_el_salto_del_proxy():
+    # El cliente puede inventar lo que está a la izquierda
+    reenviado = '6.6.6.6, 1.1.1.1'
+    assert limitador.ip_cliente(reenviado, '10.0.0.1', proxies=1) == '1.1.1.1'
+    assert limitador.ip_cliente('6.6.6.6, 1.1.1.1, 10.0.0.2', '10.0.0.1', proxies=2) == '1.1.1.1'
+
+
+def test_ip_cliente_cadena_corta_usa_ip_directa():
+    assert limitador.ip_cliente('1.1.1.1', '10.0.0.1', proxies=2) == '10.0.0.1'
+    assert limitador.ip_cliente(None, '10.0.0.1', proxies=1) == '10.0.0.1'
+
+
+def test_sin_ip_limita_solo_por_entidad(reloj, monkeypatch):
+    lim = limitador.LimitadorMemoria({'entidad': 2, 'cliente': 1})
+    monkeypatch.setattr(limitador, '_limitador', lim)
+    assert limitador.permitir_login('A', None)
+    assert limitador.permitir_login(' a ', None)
+    assert not limitador.permitir_login('A', None)
+    assert ('cliente', None) not in lim._intentos
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import datetime
+import pandas as pd
+import pytest
+import estado
+import recordatorios
+
+HOY = datetime.date(2024, 5, 1)
+
+
+class Snapshot:
+    version = 'v1'
+    df = pd.DataFrame({
+        'nombre_entidad': ['A', 'B', 'C', 'D'],
+        'vencimiento_nomina': pd.to_datetime(['2024-05-10', '2024-04-01', '2024-05-10', '2025-01-01']),
+        'vencimiento_presidente': pd.to_datetime(['2024-05-20', None, '2024-05-20', None]),
+    })
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.delenv('ESTADO_BACKEND', raising=False)
+    monkeypatch.delenv('ESTADO_DB', raising=False)
+    monkeypatch.setattr(estado, '_backends', {})
+    monkeypatch.setattr(recordatorios, 'obtener_snapshot', lambda: Snapshot)
+    db_path = str(tmp_path / 'users.db')
+    backend = estado.EstadoSQLite(db_path)
+    # C no tiene email cargado
+    for username, email in [('A', 'a@b.c'), ('B', ' b@b.c '), ('C', ''), ('D', 'd@b.c')]:
+        backend.crear_usuario(username, 'hash', 'salt')
+        backend.actualizar_perfil(username, dict(backend.obtener_perfil(username), email=email))
+    return db_path
+
+
+def outbox(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            'SELECT username, email, tipo, etapa FROM recordatorios_outbox ORDER BY id'
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_segunda_corrida_no_encola(db_path):
+    assert recordatorios.encolar_recordatorios(db_path, HOY) == {'candidatos': 3, 'encolados': 3}
+    assert sorted(outbox(db_path)) == [
+        ('A', 'a@b.c', 'vencimiento_nomina', 'proximo'),
+        ('A', 'a@b.c', 'vencimiento_presidente', 'proximo'),
+        ('B', 'b@b.c', 'vencimiento_nomina', 'vencido'),
+    ]
+    assert recordatorios.encolar_recordatorios(db_path, HOY, tam_lote=1) == {'candidatos': 3, 'encolados': 0}
+    assert len(outbox(db_path)) == 3
+
+
+def test_al_vencer_se_encola_la_nueva_etapa(db_path):
+    recordatorios.encolar_recordatorios(db_path, HOY)
+    resumen = recordatorios.encolar_recordatorios(db_path, datetime.date(2024, 5, 15))
+    assert resumen['encolados'] == 1
+    assert outbox(db_path)[-1] == ('A', 'a@b.c', 'vencimiento_nomina', 'vencido')
+
+
+def test_enviar_pendientes_una_sola_vez(db_path, tmp_path):
+    destino = str(tmp_path / 'outbox')
+    recordatorios.encolar_recordatorios(db_path, HOY)
+    assert recordatorios.enviar_pendientes(db_path, destino, tam_lote=2) == 3
+    assert len(os.listdir(destino)) == 3
+    assert recordatorios.enviar_pendientes(db_path, destino) == 0
@@ -0,0 +1,75 @@
+import threading
+import pytest
+import auditoria
+import estado
+import servidor_estado
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    servidores = []
+
+    def iniciar(tokens=None):
+        server = servidor_estado.crear_servidor(str(tmp_path / 'users.db'), '127.0.0.1', 0, tokens)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servidores.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    yield iniciar
+    for server in servidores:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sin_token_solo_en_loopback(tmp_path):
+    with pytest.raises(ValueError):
+        servidor_estado.crear_servidor(str(tmp_path / 'users.db'), '0.0.0.0', 0)
+
+
+def test_sin_token_en_loopback(servidor):
+    url = servidor()
+    backend = estado.EstadoHTTP(url)
+    assert backend.crear_usuario('A', 'hash', 'salt')
+    assert backend.eliminar_usuario('A')
+
+
+def test_token_invalido(servidor):
+    url = servidor({'app': 'clave-app', 'admin': 'clave-admin'})
+    for token in [None, 'otra']:
+        with pytest.raises(RuntimeError, match='401'):
+            estado.EstadoHTTP(url, token).obtener_credenciales('A')
+
+
+def test_permisos_por_rol(servidor):
+    url = servidor({'app': 'clave-app', 'admin': 'clave-admin'})
+    app = estado.EstadoHTTP(url, 'clave-app')
+    admin = estado.EstadoHTTP(url, 'clave-admin')
+
+    assert app.crear_usuario('A', 'hash', 'salt')
+    assert app.obtener_credenciales('A') == ['hash', 'salt']
+    with pytest.raises(RuntimeError, match='403'):
+        app.eliminar_usuario('A')
+    with pytest.raises(RuntimeError, match='403'):
+        app.actualizar_password('A', 'otro', 'salt')
+
+    assert admin.actualizar_password('A', 'otro', 'salt')
+    assert admin.eliminar_usuario('A')
+    assert app.obtener_credenciales('A') is None
+
+
+def test_auditoria_y_limitador_compartidos(servidor):
+    url = servidor({'app': 'clave-app', 'admin': 'clave-admin'})
+    replicas = [estado.EstadoHTTP(url, 'clave-app') for _ in range(2)]
+    admin = estado.EstadoHTTP(url, 'clave-admin')
+
+    for i, replica in enumerate(replicas):
+        replica.registrar_auditoria([auditoria.evento('autogestion', f'E{i}', 'login', f'E{i}')])
+    eventos, _ = admin.consultar_auditoria()
+    assert sorted(e['entidad'] for e in eventos) == ['E0', 'E1']
+    with pytest.raises(RuntimeError, match='403'):
+        replicas[0].consultar_auditoria()
+
+    # El límite por entidad no se multiplica por la cantidad de réplicas
+    resultados = [replicas[i % 2].permitir_intento({'entidad': 'a'}) for i in range(7)]
+    assert resultados == [True] * 5 + [False] * 2
+    assert admin.contadores_limitador()['rechazados'] == 2